@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+# End-to-end crawl time against the bench/standin.py server: the wishlist
+# crawl, the library crawl over its output, and page.py's rendering, each
+# timed separately with the project's settings, minus the HTTP cache and
+# with fresh Amazon API and library state caches:
+#
+#   bench/crawl.py [-l LATENCY] [-e EDITIONS] [-w ID,ID,...]
+#                  [--libraries BRL,MLN,HLS]
+#
+# --editions makes every N wishlist items editions of the same work, for
+# measuring how well duplicate catalog requests are coalesced. Every one of
+# --wishlists has the corpus' items, so crawling several should cost little
+# more than crawling one. "library top N" is when the last holding of the
+# first N wishlist items arrived.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('WISHLIST_ID', 'CORPUS')
+for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY',
+             'AMAZON_AFFILIATE_ID'):
+    os.environ.setdefault(name, 'bench')
+
+from scrapy import signals
+from scrapy.crawler import CrawlerRunner
+from scrapy.settings import Settings
+from twisted.internet import defer, reactor
+
+from standin import AmazonClient, StandInServer
+from wishlist_scraper import settings as project_settings
+from wishlist_scraper.holdings import HoldingsIndex
+from wishlist_scraper.page import (
+    PREFERRED_BRANCHES, build_template_data, group_by_wishlist,
+    read_holdings, render, sort_key)
+from wishlist_scraper.spiders import LibrarySpider, WishlistSpider
+from wishlist_scraper.utils import iter_json_lines
+
+
+class StandInWishlistSpider(WishlistSpider):
+    # The stand-in can't answer HTTPS, and the Product Advertising API is
+    # called directly rather than through Scrapy's downloader.
+    wishlist_url = 'http://www.amazon.com/registry/wishlist/{}'
+
+    def __init__(self, *args, **kwargs):
+        super(StandInWishlistSpider, self).__init__(*args, **kwargs)
+        self.amazon = AmazonClient(os.environ['http_proxy'])
+
+
+def crawl_settings(tmpdir, name):
+    settings = Settings()
+    settings.setmodule(project_settings)
+    settings.setdict({
+        'HTTPCACHE_ENABLED': False,
+        'AMAZON_API_CACHE_FILE': os.path.join(tmpdir, 'amazon-api-cache.db'),
+        'LIBRARY_STATE_FILE': os.path.join(tmpdir, 'library-state.db'),
+        'HOLDINGS_STORE_FILE': os.path.join(tmpdir, 'holdings.sqlite'),
+        'FEED_URI': os.path.join(tmpdir, '{}.jl'.format(name)),
+        'FEED_FORMAT': 'jsonlines',
+        'INSTRUMENTATION_JSON_FILE': os.path.join(
+            tmpdir, 'crawl-report-%(name)s.json'),
+        'INSTRUMENTATION_PROMETHEUS_FILE': os.path.join(
+            tmpdir, 'crawl-report-%(name)s.prom'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    return settings
+
+
+@defer.inlineCallbacks
+def run(tmpdir, wishlists, libraries, top, timings):
+    start = time.perf_counter()
+    yield CrawlerRunner(crawl_settings(tmpdir, 'wishlist')).crawl(
+        StandInWishlistSpider, wishlists=wishlists)
+    timings.append(('wishlist crawl', time.perf_counter() - start))
+
+    with open(os.path.join(tmpdir, 'wishlist.jl')) as wishlist_fp:
+        top_isbns = set(
+            item['isbn']
+            for item
+            in sorted(iter_json_lines(wishlist_fp), key=sort_key)[:top])
+    last_holding = {}
+
+    def item_scraped(item, spider):
+        last_holding[item['isbn']] = time.perf_counter() - start
+
+    runner = CrawlerRunner(crawl_settings(tmpdir, 'library'))
+    crawler = runner.create_crawler(LibrarySpider)
+    crawler.signals.connect(item_scraped, signal=signals.item_scraped)
+
+    start = time.perf_counter()
+    yield runner.crawl(
+        crawler, wishlist=os.path.join(tmpdir, 'wishlist.jl'),
+        libraries=libraries)
+    timings.append(('library top {}'.format(top), max(
+        last_holding.get(isbn, 0) for isbn in top_isbns)))
+    timings.append(('library crawl', time.perf_counter() - start))
+
+    reactor.stop()
+
+
+def render_page(tmpdir):
+    with open(os.path.join(tmpdir, 'wishlist.jl')) as wishlist_fp:
+        wishlist_items = list(iter_json_lines(wishlist_fp))
+    holdings_index = HoldingsIndex(
+        PREFERRED_BRANCHES,
+        holdings=read_holdings(os.path.join(tmpdir, 'library.jl')))
+    pages = [
+        render(build_template_data(items, holdings_index))
+        for items
+        in group_by_wishlist(wishlist_items).values()
+    ]
+    return wishlist_items, holdings_index, pages
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-l', '--latency', type=float, default=0.1)
+    arg_parser.add_argument('-e', '--editions', type=int, default=1)
+    arg_parser.add_argument('-w', '--wishlists', default='CORPUS')
+    arg_parser.add_argument('--libraries', default='BRL,MLN,HLS')
+    arg_parser.add_argument('--top', type=int, default=10)
+    args = arg_parser.parse_args()
+
+    server = StandInServer(args.latency, editions=args.editions)
+    server.start()
+    os.environ['http_proxy'] = server.url
+
+    # page.py renders from the project's templates/ directory.
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        timings = []
+        reactor.callWhenRunning(
+            run, tmpdir, args.wishlists, args.libraries.split(','), args.top,
+            timings)
+        reactor.run()
+
+        start = time.perf_counter()
+        wishlist_items, holdings_index, pages = render_page(tmpdir)
+        timings.append(('page.py', time.perf_counter() - start))
+    finally:
+        shutil.rmtree(tmpdir)
+        server.stop()
+
+    print('{} requests at {:.0f}ms latency, {} wishlist items on {} pages, '
+          '{} holdings'
+          .format(server.requests, args.latency * 1000, len(wishlist_items),
+                  len(pages),
+                  sum(len(holdings_index.get_holdings(item['isbn']))
+                      for item in wishlist_items)))
+    for stage, secs in timings:
+        print('{:15} {:7.2f}s'.format(stage, secs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Compares building branch-table rows with LibraryAvailabilityLoader (plus
+# LibraryAvailabilityPipeline) against constructing Holding records
+# directly, in rows per second and retained bytes per row:
+#
+#   bench/holdings.py [-r ROWS]
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from wishlist_scraper.items import (
+    Holding, item_values, parse_available, parse_call_num)
+from wishlist_scraper.loaders import LibraryAvailabilityLoader
+from wishlist_scraper.pipelines import LibraryAvailabilityPipeline
+
+ITEM = {'isbn': '9780446573016', 'title': 'Example'}
+ROW = (' Central Library ', ' Adult Nonfiction ', ' 658.4 HIL\xa0', ' In ')
+
+
+def loader_rows(count):
+    pipeline = LibraryAvailabilityPipeline()
+    rows = []
+    for i in range(count):
+        avail_item = LibraryAvailabilityLoader()
+        avail_item.add_value('isbn', ITEM['isbn'])
+        avail_item.add_value('library', 'MBLN')
+        avail_item.add_value('catalog_url', 'http://example.com/item/1')
+        avail_item.add_value('branch', [ROW[0]])
+        avail_item.add_value('collection', [ROW[1]])
+        avail_item.add_value('call_num', [ROW[2]])
+        avail_item.add_value('available', [ROW[3]])
+        rows.append(pipeline.process_item(avail_item.load_item(), None))
+    return rows
+
+
+def holding_rows(count):
+    pipeline = LibraryAvailabilityPipeline()
+    rows = []
+    for i in range(count):
+        rows.append(pipeline.process_item(Holding(
+            isbn=ITEM['isbn'],
+            library='MBLN',
+            catalog_url='http://example.com/item/1',
+            branch=ROW[0].strip(),
+            collection=ROW[1].strip(),
+            call_num=parse_call_num(ROW[2].strip()),
+            available=parse_available(ROW[3].strip())), None))
+    return rows
+
+
+def measure(build, count):
+    start = time.perf_counter()
+    rows = build(count)
+    secs = time.perf_counter() - start
+
+    tracemalloc.start()
+    rows = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return rows, count / secs, size / count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-r', '--rows', type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    loaded, loader_rate, loader_size = measure(loader_rows, args.rows)
+    built, holding_rate, holding_size = measure(holding_rows, args.rows)
+
+    if item_values(loaded[0]) != item_values(built[0]):
+        print('rows differ: {} != {}'.format(
+            item_values(loaded[0]), item_values(built[0])))
+
+    print('loader:  {:8.0f} rows/s {:6.0f} bytes/row'.format(
+        loader_rate, loader_size))
+    print('Holding: {:8.0f} rows/s {:6.0f} bytes/row ({:.1f}x, {:.1f}x)'.format(
+        holding_rate, holding_size,
+        holding_rate / loader_rate, loader_size / holding_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Compares LibrarySpider's JavaScript variable extraction with the slimit
+# AST walk it replaced, on saved HOLLIS pages:
+#
+#   bench/js_vars.py page.html [page.html ...]
+#
+# Each run also checks the two agree on SCRIPTS, which trip up a scanner
+# that takes a quote or slash at face value. slimit isn't a runtime
+# dependency any more; install it to run this.
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scrapy.http
+import slimit.ast
+import slimit.parser
+import slimit.visitors.nodevisitor
+
+from wishlist_scraper.jsvars import extract_js_vars
+from wishlist_scraper.spiders import LibrarySpider
+
+SCRIPTS = [
+    'var r = /"/; var after = "ok";',
+    'var s = "a".replace(/[/\'"]/g, ""); var after = "ok";',
+    'function f(s) { return /\'/.test(s); } var after = "ok";',
+    'var half = 4 / 2, quote = "/"; var third = 6 / 3 / 1;',
+]
+
+
+def slimit_js_vars(scripts):
+    parser = slimit.parser.Parser()
+
+    js_vars = {}
+    for script in scripts:
+        tree = parser.parse(script)
+        js_vars.update({
+            node.identifier.value: (
+                node.initializer.value[1:-1]
+                if isinstance(node.initializer, slimit.ast.String)
+                else node.initializer.value)
+            for node in slimit.visitors.nodevisitor.visit(tree)
+             if (isinstance(node, slimit.ast.VarDecl) and
+                 isinstance(
+                     node.initializer,
+                     (slimit.ast.String, slimit.ast.Number)))
+        })
+    return js_vars
+
+
+def regex_js_vars(scripts):
+    js_vars = {}
+    for script in scripts:
+        js_vars.update(extract_js_vars(script))
+    return js_vars
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('pages', nargs='+')
+    arg_parser.add_argument('-n', '--number', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    for script in SCRIPTS:
+        if slimit_js_vars([script]) != regex_js_vars([script]):
+            print('{!r}: results differ'.format(script))
+
+    for path in args.pages:
+        with open(path, 'rb') as page_fp:
+            response = scrapy.http.HtmlResponse(
+                'http://lms01.harvard.edu/F/', body=page_fp.read())
+        scripts = LibrarySpider._extract_script(response)
+
+        if slimit_js_vars(scripts) != regex_js_vars(scripts):
+            print('{}: results differ'.format(path))
+
+        slimit_secs = timeit.timeit(
+            lambda: slimit_js_vars(scripts), number=args.number)
+        regex_secs = timeit.timeit(
+            lambda: regex_js_vars(scripts), number=args.number)
+        print('{}: slimit {:.2f}ms, extract_js_vars {:.3f}ms ({:.0f}x)'.format(
+            path,
+            slimit_secs / args.number * 1000,
+            regex_secs / args.number * 1000,
+            slimit_secs / regex_secs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# Holdings page parse throughput in the crawl process against
+# ParseOffloadMiddleware's worker pools of 1 up to the number of CPUs, on
+# the bench/corpus fixtures:
+#
+#   bench/offload.py [-n NUMBER] [-p PROCESSES ...]
+#
+# Each pool is warmed up before it's timed, as the crawl's is once its
+# first few responses are in. Every pool's holdings are checked against
+# those parsed in-process.
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scrapy.http
+
+from standin import render
+from wishlist_scraper.offload import parse_offloaded
+from wishlist_scraper.spiders import LibrarySpider
+
+ISBN = '9780000000019'
+
+# (callback, URL, meta)
+CASES = [
+    ('parse_item_BRL_availability',
+     'http://bpl.bibliocommons.com/item/show_circulation/1?search_scope=MBLN',
+     {'isbn': ISBN, 'item_url': 'http://bpl.bibliocommons.com/item/show/1'}),
+    ('parse_item_MLN_item_full_availability',
+     'http://library.minlib.net/search~S1?/.b1/.b1/1,1,1,B/holdings~1',
+     {'isbn': ISBN}),
+    ('parse_item_HLS_item_availability',
+     'http://lms01.harvard.edu/F/1?func=item-global',
+     {'isbn': ISBN}),
+]
+
+
+def parse_args(callback, url, meta):
+    _, body = render(url)
+    return (LibrarySpider, callback, scrapy.http.HtmlResponse, url, body,
+            'utf-8', meta)
+
+
+def parse_inline(jobs):
+    return [parse_offloaded(*job) for job in jobs]
+
+
+def parse_pool(executor, jobs):
+    futures = [executor.submit(parse_offloaded, *job) for job in jobs]
+    return [future.result() for future in futures]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-n', '--number', type=int, default=200)
+    arg_parser.add_argument(
+        '-p', '--processes', type=int, nargs='*',
+        default=list(range(1, multiprocessing.cpu_count() + 1)))
+    args = arg_parser.parse_args()
+
+    print('{} CPUs'.format(multiprocessing.cpu_count()))
+
+    failed = False
+    for callback, url, meta in CASES:
+        jobs = [parse_args(callback, url, meta)] * args.number
+
+        start = time.perf_counter()
+        expected = parse_inline(jobs)
+        secs = time.perf_counter() - start
+        print('{:40} inline       {:8.0f} responses/s'.format(
+            callback, args.number / secs))
+
+        for processes in args.processes:
+            with ProcessPoolExecutor(
+                    processes,
+                    mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                parse_pool(executor, jobs[:processes * 2])
+
+                start = time.perf_counter()
+                outputs = parse_pool(executor, jobs)
+                secs = time.perf_counter() - start
+
+            status = ''
+            if outputs != expected:
+                failed = True
+                status = '  REGRESSION: holdings differ from inline'
+            print('{:40} {:2} processes {:8.0f} responses/s{}'.format(
+                '', processes, args.number / secs, status))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# Parse throughput of every spider callback on the bench/corpus fixtures,
+# with no network involved:
+#
+#   bench/parse.py [-n NUMBER] [callback ...]
+#
+# Each callback's output count is checked against what its fixture should
+# produce, so parser regressions show up alongside slowdowns.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('WISHLIST_ID', 'CORPUS')
+for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY',
+             'AMAZON_AFFILIATE_ID'):
+    os.environ.setdefault(name, 'bench')
+
+import scrapy.http
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from standin import render
+from wishlist_scraper import settings as project_settings
+from wishlist_scraper.amazon_api_cache import AmazonApiCache
+from wishlist_scraper.library_state import LibraryLookup
+from wishlist_scraper.spiders import (
+    AMAZON_API_URL, LibrarySpider, WishlistSpider)
+from wishlist_scraper.utils import isbn_variants
+
+ITEM = {
+    'isbn': '9780000000019',
+    'title': 'Corpus Book 1: A Novel (Corpus Edition)',
+    'by': 'Author 1',
+}
+ISBNS = isbn_variants([ITEM['isbn']])
+# standin.MISSING_ISBN: searches for this come up empty.
+MISSING_ISBNS = isbn_variants(['9780000000101'])
+WISHLIST_ITEMS = [
+    ('C0000{:05d}'.format(i), 'CORPUS', str(i)) for i in range(1, 11)]
+
+
+def fallback_meta(library):
+    return {
+        'fallback_url': getattr(
+            LibrarySpider, '_build_{}_url'.format(library))(ITEM, library),
+        'library_lookups': [LibraryLookup(ITEM['isbn'], library)],
+    }
+
+
+# (spider, callback, URL, meta, expected number of outputs)
+CASES = [
+    ('wishlist', 'parse_wishlist_page',
+     'http://www.amazon.com/registry/wishlist/CORPUS',
+     {'wishlist': 'CORPUS'}, 4),
+    ('wishlist', 'parse_amazon_items',
+     '{}?ItemId={}'.format(
+         AMAZON_API_URL,
+         ','.join(asin for asin, _, _ in WISHLIST_ITEMS)),
+     {'wishlist_items': WISHLIST_ITEMS}, 10),
+    ('library', 'parse_BRL_response',
+     LibrarySpider._build_BRL_url(ITEM, 'BRL'), {}, 3),
+    ('library', 'parse_BRL_response',
+     LibrarySpider._build_BRL_isbn_url(ISBNS), {}, 1),
+    ('library', 'parse_BRL_response',
+     LibrarySpider._build_BRL_isbn_url(MISSING_ISBNS),
+     fallback_meta('BRL'), 1),
+    ('library', 'parse_item_BRL_availability',
+     'http://bpl.bibliocommons.com/item/show_circulation/1?search_scope=MBLN',
+     {'item_url': 'http://bpl.bibliocommons.com/item/show/1'}, 30),
+    ('library', 'parse_MLN_response',
+     LibrarySpider._build_MLN_url(ITEM, 'MLN'), {}, 2),
+    ('library', 'parse_MLN_response',
+     LibrarySpider._build_MLN_isbn_url(ISBNS), {}, 1),
+    ('library', 'parse_MLN_response',
+     LibrarySpider._build_MLN_isbn_url(MISSING_ISBNS),
+     fallback_meta('MLN'), 1),
+    ('library', 'parse_item_MLN',
+     'http://library.minlib.net/record=b1~S1', {}, 1),
+    ('library', 'parse_item_MLN_item_full_availability',
+     'http://library.minlib.net/search~S1?/.b1/.b1/1,1,1,B/holdings~1',
+     {}, 41),
+    ('library', 'parse_HLS_response',
+     LibrarySpider._build_HLS_url(ITEM, 'HLS'), {}, 1),
+    ('library', 'parse_HLS_response',
+     LibrarySpider._build_HLS_isbn_url(ISBNS), {}, 1),
+    ('library', 'parse_item_HLS_sso_redirect',
+     'http://lms01.harvard.edu/pds?func=sso&url=', {}, 1),
+    ('library', 'parse_item_HLS_item_list',
+     'http://lms01.harvard.edu/F/1?func=find-c-list', {}, 1),
+    ('library', 'parse_item_HLS_item_list',
+     'http://lms01.harvard.edu/F/1?func=short-jump', fallback_meta('HLS'),
+     1),
+    ('library', 'parse_item_HLS_item',
+     'http://lms01.harvard.edu/F/1?func=full-set-set', {}, 1),
+    ('library', 'parse_item_HLS_item_availability',
+     'http://lms01.harvard.edu/F/1?func=item-global', {}, 6),
+]
+
+
+def make_response(url, meta):
+    content_type, body = render(url)
+    meta = dict(meta, isbn=ITEM['isbn'])
+    response_class = (
+        scrapy.http.XmlResponse if 'xml' in content_type
+        else scrapy.http.HtmlResponse)
+    return response_class(
+        url, body=body, encoding='utf-8',
+        request=scrapy.http.Request(url, meta=meta))
+
+
+def run_case(spider, callback, response, tmpdir):
+    if isinstance(spider, WishlistSpider):
+        # An empty cache every time, so each parse sees the same misses.
+        settings = Settings()
+        settings.setmodule(project_settings)
+        settings.set('AMAZON_API_CACHE_FILE', tempfile.mktemp(dir=tmpdir))
+        spider.amazon_api_cache = AmazonApiCache.from_settings(settings)
+        spider.item_nums.clear()
+        spider.amazon_lookups.clear()
+
+    start = time.perf_counter()
+    outputs = list(getattr(spider, callback)(response))
+    secs = time.perf_counter() - start
+
+    if isinstance(spider, WishlistSpider):
+        spider.amazon_api_cache.close()
+    return outputs, secs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('callbacks', nargs='*')
+    arg_parser.add_argument('-n', '--number', type=int, default=50)
+    args = arg_parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    settings = {
+        'AMAZON_API_CACHE_FILE': os.path.join(tmpdir, 'amazon.db'),
+        'LIBRARY_STATE_FILE': os.path.join(tmpdir, 'library-state.db'),
+    }
+    spiders = {
+        spider_class.name: spider_class.from_crawler(
+            get_crawler(spider_class, settings))
+        for spider_class in (WishlistSpider, LibrarySpider)
+    }
+    # run_case() gives the wishlist spider a fresh cache each time.
+    spiders['wishlist'].amazon_api_cache.close()
+
+    try:
+        failed = False
+        for spider_name, callback, url, meta, expected in CASES:
+            if args.callbacks and callback not in args.callbacks:
+                continue
+
+            total_secs = 0
+            for i in range(args.number):
+                # A fresh response each time: callbacks memoize per response.
+                outputs, secs = run_case(
+                    spiders[spider_name], callback, make_response(url, meta),
+                    tmpdir)
+                total_secs += secs
+
+            status = ''
+            if len(outputs) != expected:
+                failed = True
+                status = '  REGRESSION: {} outputs, expected {}'.format(
+                    len(outputs), expected)
+            print('{:40} {:8.0f} responses/s {:9.0f} outputs/s{}'.format(
+                callback,
+                args.number / total_secs,
+                args.number * len(outputs) / total_secs,
+                status))
+    finally:
+        spiders['library'].library_state.close()
+        shutil.rmtree(tmpdir)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
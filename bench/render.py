@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# Times building the page's template data and rendering it, for a
+# synthetic wishlist whose items have many holdings each:
+#
+#   bench/render.py [-i ITEMS] [-H HOLDINGS] [--templates DIR]
+#
+# Point --templates at an older checkout's templates/ to compare; items
+# still carry their raw `holdings` and `display_branches`. Also timed is
+# the page command's LivePage answering a request after one holding has
+# arrived, which renders just that item again.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from wishlist_scraper.holdings import HoldingsIndex
+from wishlist_scraper.page import (
+    PREFERRED_BRANCHES, LivePage, build_template_data, get_environment,
+    render)
+
+BRANCHES = {
+    'MBLN': ['BPL - Central', 'INTERNET'] + [
+        'BPL - Branch {}'.format(i) for i in range(25)],
+    'Minuteman': ['CAMBRIDGE', 'INTERNET'] + [
+        'Town {}'.format(i) for i in range(35)],
+}
+
+
+def synthesize(item_count, holding_count):
+    rng = random.Random(0)
+    items = []
+    holdings = []
+    for i in range(item_count):
+        isbn = '978{:010d}'.format(i)
+        items.append({
+            'isbn': isbn,
+            'title': 'Title {}'.format(i),
+            'by': 'Author {}'.format(i),
+            'sort_key': str(i),
+            'amazon_url': 'http://www.amazon.com/dp/{}'.format(isbn),
+            'image': {
+                'url': 'http://images.example.com/{}.jpg'.format(isbn),
+                'width': '75',
+                'height': '110',
+                'caption': 'Title {}'.format(i),
+            },
+            'rating_overview': {'url': 'http://www.amazon.com/reviews'},
+            'amazon_prices': {},
+            'format': 'Hardcover',
+        })
+        for j in range(holding_count):
+            library = rng.choice(sorted(BRANCHES))
+            branch = rng.choice(BRANCHES[library])
+            holding = {
+                'isbn': isbn,
+                'library': library,
+                'branch': branch,
+                'collection': 'Adult',
+                'call_num': 'FIC {}'.format(rng.randint(0, 3)),
+                'catalog_url': 'http://catalog.example.com/{}'.format(j),
+                'available': rng.random() < 0.5,
+                'copies': 1,
+                'holds': rng.randint(0, 3),
+            }
+            if branch == 'INTERNET':
+                holding['digital_url'] = 'http://overdrive.example.com/'
+            holdings.append(holding)
+    return items, holdings
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-i', '--items', type=int, default=200)
+    arg_parser.add_argument('-H', '--holdings', type=int, default=60)
+    arg_parser.add_argument('-n', '--number', type=int, default=5)
+    arg_parser.add_argument('--templates', default='templates')
+    args = arg_parser.parse_args()
+
+    items, holdings = synthesize(args.items, args.holdings)
+    live = os.path.exists(os.path.join(args.templates, 'item.html'))
+    if live:
+        render_page = lambda template_data: render(
+            template_data, args.templates)
+    else:
+        # Older templates render each item inline.
+        render_page = get_environment(args.templates).get_template(
+            'main.html').render
+
+    build_secs = render_secs = 0
+    for i in range(args.number):
+        start = time.perf_counter()
+        template_data = build_template_data(
+            [dict(item) for item in items],
+            HoldingsIndex(PREFERRED_BRANCHES, holdings=holdings))
+        build_secs += time.perf_counter() - start
+
+        start = time.perf_counter()
+        render_page(template_data)
+        render_secs += time.perf_counter() - start
+
+    print('{} items x {} holdings: build {:.1f}ms, render {:.1f}ms'.format(
+        args.items, args.holdings,
+        build_secs / args.number * 1000,
+        render_secs / args.number * 1000))
+
+    if not live:
+        return
+
+    live_page = LivePage(
+        HoldingsIndex(PREFERRED_BRANCHES, holdings=holdings), args.templates)
+    for item in items:
+        live_page.add_item(dict(item))
+    live_page.render()
+
+    live_secs = 0
+    for i in range(args.number):
+        holding = dict(holdings[i % len(holdings)])
+        start = time.perf_counter()
+        live_page.add_holding(holding)
+        live_page.render()
+        live_secs += time.perf_counter() - start
+
+    print('live page after one new holding: {:.1f}ms'.format(
+        live_secs / args.number * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# A local stand-in for Amazon and the library catalogs, replaying the
+# fixture corpus in bench/corpus/ with a configurable per-request latency.
+# It answers as an HTTP proxy, so the spiders' own catalog URLs work
+# unchanged once `http_proxy` points at it:
+#
+#   bench/standin.py --port 8765 --latency 0.2 &
+#   http_proxy=http://127.0.0.1:8765 scrapy crawl library
+#
+# The corpus is synthesized, not recorded: each fixture reproduces the
+# markup the spiders' selectors depend on, trimmed of everything else.
+# Fixtures are string.Template files; $key is a digest of the requested
+# URL, so every search leads to its own chain of follow-up pages. With
+# --editions N, every N consecutive wishlist ASINs are editions of one work,
+# sharing its title and author as a wishlist's duplicates would. ISBN
+# searches find the one matching record, except for every tenth wishlist
+# item's, so title and author fallbacks happen too. Hollis sessions expire
+# after --session-searches searches, bouncing the next one back to the
+# SSO handshake.
+
+import argparse
+import hashlib
+import html
+import os
+import re
+import string
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote_plus, urlencode, urlsplit
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+# (host, pattern matched against the path and query, fixture)
+ROUTES = [
+    ('www.amazon.com', r'^/registry/wishlist/', 'amazon/wishlist-1.html'),
+    ('www.amazon.com', r'^/hz/wishlist/slv/items', 'amazon/wishlist-2.html'),
+    ('webservices.amazon.com', r'^/onca/xml', None),
+    ('bpl.bibliocommons.com', r'^/search\?custom_query=identifier',
+     'bibliocommons/search-isbn.html'),
+    ('bpl.bibliocommons.com', r'^/search', 'bibliocommons/search.html'),
+    ('bpl.bibliocommons.com', r'^/item/show_circulation/',
+     'bibliocommons/circulation.html'),
+    ('library.minlib.net', r'^/search/X\?SEARCH=i%3A',
+     'minlib/search-isbn.html'),
+    ('library.minlib.net', r'^/search/X', 'minlib/search.html'),
+    ('library.minlib.net', r'^/record=', 'minlib/item.html'),
+    ('library.minlib.net', r'^/search~S1\?.*/holdings', 'minlib/holdings.html'),
+    ('lms01.harvard.edu', r'^/F/\?func=find-b&', 'hollis/find-isbn.html'),
+    ('lms01.harvard.edu', r'^/F/\?func=find-c&', 'hollis/find.html'),
+    ('lms01.harvard.edu', r'^/F/\w+\?func=find-b&', 'hollis/item.html'),
+    ('lms01.harvard.edu', r'^/F/\w+\?func=find-c&', 'hollis/item-list.html'),
+    ('lms01.harvard.edu', r'^/pds\?func=sso', 'hollis/sso.html'),
+    ('lms01.harvard.edu', r'func=find-c-list', 'hollis/item-list.html'),
+    ('lms01.harvard.edu', r'func=full-set-set', 'hollis/item.html'),
+    ('lms01.harvard.edu', r'func=item-global', 'hollis/availability.html'),
+    ('lms01.harvard.edu', r'func=short-jump', 'hollis/no-results.html'),
+]
+
+# ISBN searches for any of these come up empty, answered with the second
+# fixture instead of the first.
+MISSING_ISBN = re.compile(r'\b9780\d{7}0\d\b')
+ISBN_MISSES = {
+    'bibliocommons/search-isbn.html': 'bibliocommons/search-none.html',
+    'minlib/search-isbn.html': 'minlib/search-none.html',
+    'hollis/find-isbn.html': 'hollis/find-none.html',
+    'hollis/item.html': 'hollis/no-results.html',
+}
+
+HOLLIS_SESSION_SEARCH = re.compile(
+    r'^http://lms01\.harvard\.edu/F/(\w+)\?(func=find-.*)$')
+
+# ASINs starting with this are answered with AWS.InvalidParameterValue.
+INVALID_ASIN_PREFIX = 'X'
+
+_fixtures = {}
+
+
+def fixture(name):
+    if name not in _fixtures:
+        with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as fp:
+            _fixtures[name] = string.Template(fp.read())
+    return _fixtures[name]
+
+
+def book(key):
+    return {
+        'title': 'Corpus Book {}'.format(key),
+        'author': 'Author {}'.format(key),
+    }
+
+
+def asin_isbn(asin):
+    digits = '9780{}'.format(asin[-8:])
+    check = -sum(
+        int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10
+    return '{}{}'.format(digits, check)
+
+
+def item_lookup(query, editions=1):
+    items = []
+    errors = []
+    for asin in parse_qs(query).get('ItemId', [''])[0].split(','):
+        if asin.startswith(INVALID_ASIN_PREFIX):
+            errors.append(fixture('amazon/error.xml').safe_substitute(
+                asin=asin))
+            continue
+        work = (int(asin[-5:]) - 1) // editions + 1
+        items.append(fixture('amazon/item.xml').safe_substitute(
+            asin=asin, isbn=asin_isbn(asin), **book(work)))
+
+    return fixture('amazon/item-lookup.xml').safe_substitute(
+        items=''.join(items), errors=''.join(errors))
+
+
+def render(url, editions=1):
+    # The fixture answering `url`, as (content type, body), or None.
+    parts = urlsplit(url)
+    host = parts.hostname
+    target = re.sub('/+', '/', parts.path)
+    if parts.query:
+        target = '{}?{}'.format(target, parts.query)
+
+    for route_host, pattern, name in ROUTES:
+        if route_host != host or not re.search(pattern, target):
+            continue
+
+        if name is None:
+            return 'text/xml', item_lookup(
+                parts.query, editions).encode('utf-8')
+
+        if name in ISBN_MISSES and MISSING_ISBN.search(
+                unquote_plus(parts.query)):
+            name = ISBN_MISSES[name]
+
+        # Query parameters are available to fixtures too, e.g. the URL
+        # Hollis's SSO page continues to.
+        params = {
+            param: html.escape(values[0])
+            for param, values
+            in parse_qs(parts.query).items()
+        }
+        key = hashlib.md5(url.encode('utf-8')).hexdigest()[:10]
+        body = fixture(name).safe_substitute(params, key=key, **book(key))
+        return 'text/html; charset=utf-8', body.encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = self.path
+        if not urlsplit(url).scheme:
+            url = 'http://{}{}'.format(self.headers['Host'], url)
+
+        time.sleep(self.server.latency)
+        self.server.requests += 1
+
+        match = HOLLIS_SESSION_SEARCH.match(url)
+        if match and self.server.expire_session(match.group(1)):
+            url = 'http://lms01.harvard.edu/F/?{}'.format(match.group(2))
+
+        answer = render(url, self.server.editions)
+        if answer is None:
+            self.send_error(404)
+            return
+
+        content_type, body = answer
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(object):
+    def __init__(self, latency=0.0, port=0, editions=1,
+                 session_searches=20):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.editions = editions
+        self.httpd.requests = 0
+        self.httpd.expire_session = self.expire_session
+        self.session_searches = session_searches
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def expire_session(self, session):
+        # Whether this search finds the session expired.
+        with self.lock:
+            self.sessions[session] = self.sessions.get(session, 0) + 1
+            return self.sessions[session] > self.session_searches
+
+    def start(self):
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class AmazonClient(object):
+    # Takes the place of WishlistSpider's bottlenose client, sending
+    # Product Advertising API calls to the stand-in instead.
+
+    def __init__(self, proxy_url):
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({'http': proxy_url}))
+
+    def ItemLookup(self, **params):
+        url = 'http://webservices.amazon.com/onca/xml?{}'.format(
+            urlencode(sorted(params.items())))
+        return self.opener.open(url).read()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-p', '--port', type=int, default=8765)
+    arg_parser.add_argument('-l', '--latency', type=float, default=0.0)
+    arg_parser.add_argument('-e', '--editions', type=int, default=1)
+    arg_parser.add_argument('--session-searches', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    server = StandInServer(
+        args.latency, args.port, args.editions, args.session_searches)
+    print('Serving bench/corpus at {}'.format(server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
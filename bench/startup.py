@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# Cold start of each crawl, measured in fresh interpreters: importing
+# Scrapy and the project's settings, loading the spiders as Scrapy does for
+# any crawl, and creating the one crawled. Also listed are which of the
+# heavier optional dependencies were imported along the way:
+#
+#   bench/startup.py [-n NUMBER] [spider ...]
+#
+# The library crawl is started without WISHLIST_ID or the Amazon
+# credentials set, as it doesn't need them.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ['bottlenose', '_gdbm', 'requests']
+
+AMAZON_ENVIRON = {
+    'WISHLIST_ID': 'CORPUS',
+    'AWS_ACCESS_KEY_ID': 'bench',
+    'AWS_SECRET_ACCESS_KEY': 'bench',
+    'AMAZON_AFFILIATE_ID': 'bench',
+}
+
+CHILD = '''
+import json
+import os
+import sys
+import time
+
+start = time.perf_counter()
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.test import get_crawler
+settings = get_project_settings()
+imported = time.perf_counter()
+
+spider_class = SpiderLoader.from_settings(settings).load(sys.argv[1])
+loaded = time.perf_counter()
+
+settings.setdict({
+    'AMAZON_API_CACHE_FILE': os.path.join(sys.argv[2], 'amazon.db'),
+    'LIBRARY_STATE_FILE': os.path.join(sys.argv[2], 'library-state.db'),
+})
+spider_class.from_crawler(get_crawler(spider_class, settings.copy_to_dict()))
+created = time.perf_counter()
+
+print(json.dumps({
+    'scrapy': imported - start,
+    'spiders': loaded - imported,
+    'spider': created - loaded,
+    'modules': [name for name in %r if name in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+
+def run_child(spider, tmpdir):
+    env = dict(os.environ, SCRAPY_SETTINGS_MODULE='wishlist_scraper.settings')
+    for name in AMAZON_ENVIRON:
+        env.pop(name, None)
+    if spider == 'wishlist':
+        env.update(AMAZON_ENVIRON)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [PROJECT_DIR] + env.get('PYTHONPATH', '').split(os.pathsep))
+
+    output = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-c', CHILD, spider, tmpdir],
+        cwd=tmpdir, env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('spiders', nargs='*')
+    arg_parser.add_argument('-n', '--number', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    for spider in args.spiders or ['wishlist', 'library']:
+        runs = []
+        for i in range(args.number):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                runs.append(run_child(spider, tmpdir))
+
+        # The fastest run is the least disturbed by everything else.
+        best = {
+            stage: min(run[stage] for run in runs) * 1000
+            for stage in ('scrapy', 'spiders', 'spider')
+        }
+        print('{:10} scrapy {:6.1f}ms  spiders {:6.1f}ms  spider {:6.1f}ms'
+              '  imported: {}'.format(
+                  spider, best['scrapy'], best['spiders'], best['spider'],
+                  ', '.join(runs[0]['modules']) or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Two HoldingsStorePipelines writing to one holdings store at once, as the
+# wishlist and library crawls of `scrapy page` do, with their items
+# interleaved the way the reactor hands them over:
+#
+#   bench/store.py [-n NUMBER]
+#
+# Every item has to come out of both pipelines and be read back from the
+# store, and neither pipeline may wait on the other's lock.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scrapy.settings import Settings
+
+from wishlist_scraper import settings as project_settings
+from wishlist_scraper.items import Holding, WishlistItem
+from wishlist_scraper.pipelines import HoldingsStorePipeline
+from wishlist_scraper.store import HoldingsStore
+
+
+class Spider(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-n', '--number', type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        settings = Settings()
+        settings.setmodule(project_settings)
+        settings.set(
+            'HOLDINGS_STORE_FILE', os.path.join(tmpdir, 'holdings.sqlite'))
+        # Short enough that a lock held across items fails the bench
+        # rather than stalling it.
+        settings.set('HOLDINGS_STORE_TIMEOUT', 0.1)
+
+        spiders = [Spider('wishlist'), Spider('library')]
+        pipelines = [HoldingsStorePipeline(settings) for spider in spiders]
+        for pipeline, spider in zip(pipelines, spiders):
+            pipeline.open_spider(spider)
+
+        passed = 0
+        slowest = 0
+        start = time.perf_counter()
+        for i in range(args.number):
+            isbn = '{:013d}'.format(i)
+            items = [
+                WishlistItem(
+                    wishlist='BENCH', sort_key=str(i), isbn=isbn,
+                    title='Bench Book {}'.format(i)),
+                Holding(isbn=isbn, library='BENCH', branch='Main'),
+            ]
+            for pipeline, spider, item in zip(pipelines, spiders, items):
+                item_start = time.perf_counter()
+                if pipeline.process_item(item, spider) is item:
+                    passed += 1
+                slowest = max(slowest, time.perf_counter() - item_start)
+        secs = time.perf_counter() - start
+
+        for pipeline, spider in zip(pipelines, spiders):
+            pipeline.spider_closed(spider, 'finished')
+
+        store = HoldingsStore(settings.get('HOLDINGS_STORE_FILE'))
+        wishlist_items = list(store.wishlist_items(
+            store.last_runs('wishlist')[0]))
+        holdings = list(store.holdings(
+            store.last_runs('library')[0],
+            ['{:013d}'.format(i) for i in range(args.number)]))
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print('{:8.0f} items/s  slowest item {:6.1f}ms'.format(
+        2 * args.number / secs, slowest * 1000))
+    failed = False
+    for what, count, expected in [
+            ('items passed', passed, 2 * args.number),
+            ('wishlist items stored', len(wishlist_items), args.number),
+            ('holdings stored', len(holdings), args.number)]:
+        if count != expected:
+            failed = True
+            print('REGRESSION: {} {}, expected {}'.format(
+                count, what, expected))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
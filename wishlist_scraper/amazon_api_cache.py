@@ -0,0 +1,165 @@
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+
+class AmazonApiCache(object):
+    # Product Advertising API responses cached per ASIN in a gdbm file.
+    #
+    # Every value starts with a b'<stored_at> <expires_at>\n' header. Known
+    # invalid ASINs are cached as empty entries under a separate key prefix.
+    # The gdbm file is opened without its own locking for each batch of
+    # operations, guarded by flock() on a sidecar lock file, so several
+    # crawl processes can share one cache.
+
+    def __init__(self, path, ttls, default_ttl, negative_ttl, max_bytes,
+                 compact_interval):
+        self.path = path
+        self.lock_path = '{}.lock'.format(path)
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.compact_interval = compact_interval
+        self.writes = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get('AMAZON_API_CACHE_FILE'),
+            settings.getdict('AMAZON_API_CACHE_TTL'),
+            settings.getint('AMAZON_API_CACHE_DEFAULT_TTL'),
+            settings.getint('AMAZON_API_CACHE_NEGATIVE_TTL'),
+            settings.getint('AMAZON_API_CACHE_MAX_BYTES'),
+            settings.getint('AMAZON_API_CACHE_COMPACT_INTERVAL'))
+
+    @contextmanager
+    def _open(self, write=False):
+        with open(self.lock_path, 'a') as lock_fp:
+            fcntl.flock(lock_fp, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            try:
+                if not write and not os.path.exists(self.path):
+                    # Nothing has been cached yet.
+                    yield {}
+                    return
+
+                import _gdbm
+                db = _gdbm.open(self.path, 'cu' if write else 'ru')
+                try:
+                    yield db
+                finally:
+                    db.close()
+            finally:
+                fcntl.flock(lock_fp, fcntl.LOCK_UN)
+
+    @classmethod
+    def _product_key(cls, asin, response_groups):
+        return 'product:{}:{}'.format(','.join(response_groups), asin)
+
+    @classmethod
+    def _invalid_key(cls, asin):
+        return 'invalid:{}'.format(asin)
+
+    @classmethod
+    def _pack(cls, data, ttl, now):
+        return b'%d %d\n' % (now, now + ttl) + data
+
+    @classmethod
+    def _unpack(cls, value):
+        header, _, data = value.partition(b'\n')
+        try:
+            stored_at, expires_at = [int(i) for i in header.split()]
+        except ValueError:
+            # Raw responses cached by bottlenose before entries carried a
+            # header; treat them as expired.
+            return 0, 0, b''
+        return stored_at, expires_at, data
+
+    def ttl(self, response_groups):
+        # A combined lookup is only as fresh as its most volatile group.
+        return min(
+            self.ttls.get(group, self.default_ttl)
+            for group
+            in response_groups
+        )
+
+    def get_products(self, asins, response_groups):
+        now = time.time()
+        products = {}
+        invalid = set()
+
+        with self._open() as db:
+            for asin in asins:
+                key = self._invalid_key(asin)
+                if key in db and self._unpack(db[key])[1] > now:
+                    invalid.add(asin)
+                    continue
+
+                key = self._product_key(asin, response_groups)
+                if key not in db:
+                    continue
+                _, expires_at, data = self._unpack(db[key])
+                if expires_at > now:
+                    products[asin] = data
+
+        return products, invalid
+
+    def set_products(self, products, response_groups):
+        now = int(time.time())
+        ttl = self.ttl(response_groups)
+        self._write(
+            (self._product_key(asin, response_groups),
+             self._pack(data, ttl, now))
+            for asin, data
+            in products.items()
+        )
+
+    def set_invalid(self, asins):
+        now = int(time.time())
+        self._write(
+            (self._invalid_key(asin), self._pack(b'', self.negative_ttl, now))
+            for asin
+            in asins
+        )
+
+    def _write(self, entries):
+        with self._open(write=True) as db:
+            for key, value in entries:
+                db[key] = value
+                self.writes += 1
+
+            if self.writes >= self.compact_interval:
+                self._compact(db)
+
+    def compact(self):
+        with self._open(write=True) as db:
+            self._compact(db)
+
+    def _compact(self, db):
+        now = time.time()
+        entries = []
+        total_bytes = 0
+
+        key = db.firstkey()
+        while key is not None:
+            stored_at, expires_at, _ = self._unpack(db[key])
+            size = len(key) + len(db[key])
+            entries.append((stored_at, expires_at, size, key))
+            total_bytes += size
+            key = db.nextkey(key)
+
+        # Drop expired entries, then the oldest ones until the cache fits
+        # within max_bytes.
+        for stored_at, expires_at, size, key in sorted(entries):
+            if expires_at > now and total_bytes <= self.max_bytes:
+                continue
+            del db[key]
+            total_bytes -= size
+
+        db.reorganize()
+        self.writes = 0
+
+    def close(self):
+        if self.writes:
+            self.compact()
@@ -0,0 +1,167 @@
+import collections
+
+import scrapy.http
+from w3lib.url import canonicalize_url
+
+from .items import item_values
+
+
+class CoalescedRequest(object):
+    # One catalog URL and every LibraryLookup waiting on it. Once it has
+    # been parsed, the holdings it produced and the follow-up requests it
+    # made are kept, so later subscribers can be answered without asking
+    # the catalog again.
+
+    IN_FLIGHT, PARSING, DONE = range(3)
+
+    def __init__(self, lookups):
+        self.state = self.IN_FLIGHT
+        self.lookups = lookups
+        self.late_lookups = []
+        self.holdings = []
+        self.requests = []
+
+
+class RequestCoalescer(object):
+    # Shares LibrarySpider's catalog requests between wishlist items that
+    # lead to the same searches and pages, e.g. the hardcover, paperback
+    # and Kindle editions of one book. A request whose URL is already in
+    # flight is dropped and its LibraryLookups subscribe to the original;
+    # one whose URL has already been parsed is answered by replaying the
+    # recorded holdings and follow-up requests for the new subscribers,
+    # which in turn coalesce with whatever they lead to. Holdings parsed
+    # from a shared response are fanned out to every subscriber's ISBN.
+    #
+    # Lookups are counted through all of this as LibraryStateMiddleware
+    # expects: a dropped request's lookups are settled by the response
+    # they subscribed to, a replay by its own data: response.
+    #
+    # Only the max_records most recently used DONE records are kept, the
+    # rest forgotten along with their holdings and follow-up requests; a
+    # request for a forgotten URL goes out afresh.
+
+    def __init__(self, stats, replay_callback, max_records):
+        self.stats = stats
+        self.replay_callback = replay_callback
+        self.max_records = max_records
+        self.requests = {}
+        # Keys of the DONE records, least recently used first.
+        self.done = collections.OrderedDict()
+
+    @classmethod
+    def _key(cls, request):
+        return (
+            canonicalize_url(request.url),
+            getattr(request.callback, '__name__', None))
+
+    def add(self, request, spider):
+        # The request to schedule in place of `request`, if any.
+        lookups = request.meta.get('library_lookups')
+        if lookups is None or request.url.startswith('data:'):
+            return request
+
+        key = self._key(request)
+        coalesced = self.requests.get(key)
+        if coalesced is None:
+            # Copied, since sibling requests share their parent's list. The
+            # key is kept too, as a downloader middleware may rewrite the
+            # URL, e.g. HollisSessionMiddleware.
+            request.meta['library_lookups'] = list(lookups)
+            request.meta['coalesce_key'] = key
+            self.requests[key] = CoalescedRequest(
+                request.meta['library_lookups'])
+            return request
+
+        if coalesced.state == CoalescedRequest.IN_FLIGHT:
+            self.stats.inc_value('coalescing/joined', spider=spider)
+            coalesced.lookups.extend(lookups)
+            return None
+
+        self.stats.inc_value('coalescing/replayed', spider=spider)
+        if coalesced.state == CoalescedRequest.PARSING:
+            # Replayed once parsing finishes and the record is complete.
+            coalesced.late_lookups.extend(lookups)
+            return None
+        self.done.move_to_end(key)
+        return self._replay(coalesced, lookups, request.priority)
+
+    def _replay(self, coalesced, lookups, priority):
+        return scrapy.http.Request(
+            'data:,',
+            meta={
+                'isbn': lookups[0].isbn,
+                'library_lookups': list(lookups),
+                'holdings': coalesced.holdings,
+                'requests': coalesced.requests,
+                'dont_cache': True,
+            },
+            priority=priority,
+            dont_filter=True,
+            callback=self.replay_callback)
+
+    def _get(self, response):
+        if 'coalesce_key' not in response.meta:
+            return None
+        coalesced = self.requests.get(response.meta['coalesce_key'])
+        if (coalesced is None or
+                coalesced.lookups is not response.meta['library_lookups']):
+            return None
+        return coalesced
+
+    def start(self, response):
+        coalesced = self._get(response)
+        if coalesced is not None:
+            coalesced.state = CoalescedRequest.PARSING
+
+    def process_output(self, response, result, spider):
+        coalesced = self._get(response)
+        isbns = sorted(set(
+            lookup.isbn
+            for lookup
+            in response.meta.get('library_lookups', ())))
+
+        for output in result:
+            if isinstance(output, scrapy.http.Request):
+                if coalesced is not None:
+                    coalesced.requests.append(output)
+                output = self.add(output, spider)
+                if output is not None:
+                    yield output
+                continue
+
+            if coalesced is not None:
+                holding = item_values(output)
+                holding.pop('isbn', None)
+                coalesced.holdings.append(holding)
+
+            if len(isbns) <= 1:
+                yield output
+                continue
+            for isbn in isbns:
+                yield type(output)(**dict(item_values(output), isbn=isbn))
+
+        if coalesced is None:
+            return
+
+        coalesced.state = CoalescedRequest.DONE
+        if coalesced.late_lookups:
+            yield self._replay(
+                coalesced, coalesced.late_lookups, response.request.priority)
+            coalesced.late_lookups = []
+        self._retire(response.meta['coalesce_key'], spider)
+
+    def _retire(self, key, spider):
+        self.done[key] = None
+        while len(self.done) > self.max_records:
+            key, _ = self.done.popitem(last=False)
+            del self.requests[key]
+            self.stats.inc_value('coalescing/forgotten', spider=spider)
+
+    def fail(self, response):
+        # Forget a request whose callback failed, so it's tried afresh
+        # next time it comes up; its subscribers are left stale.
+        coalesced = self._get(response)
+        if coalesced is not None:
+            del self.requests[response.meta['coalesce_key']]
+            for lookup in coalesced.late_lookups:
+                lookup.failed = True
@@ -0,0 +1,38 @@
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from ..store import HoldingsStore
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def short_desc(self):
+        return 'Show how holdings changed since the previous library crawl'
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_option(
+            '--since', type='int', metavar='RUN',
+            help='compare with this run rather than the one before the '
+                 'last')
+
+    def run(self, args, opts):
+        store = HoldingsStore.from_settings(self.settings)
+        try:
+            runs = store.last_runs('library', 2)
+            if opts.since is not None:
+                runs = runs[:1] + [opts.since]
+            if len(runs) < 2:
+                raise UsageError(
+                    'fewer than two finished library crawls in {}'.format(
+                        self.settings.get('HOLDINGS_STORE_FILE')),
+                    print_help=False)
+
+            print('Changes from run {} to run {}:'.format(runs[1], runs[0]))
+            for change in store.changes(runs[0], runs[1]):
+                print('{isbn} {library} {branch}: '
+                      '{available_before}/{copies_before} -> '
+                      '{available}/{copies} available'.format(**change))
+        finally:
+            store.close()
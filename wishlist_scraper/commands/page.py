@@ -0,0 +1,138 @@
+import logging
+
+from scrapy import signals
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.web import resource, server
+
+from ..holdings import HoldingsIndex
+from ..items import item_values
+from ..page import PREFERRED_BRANCHES, LivePage, page_file
+from ..utils import write_file
+
+
+logger = logging.getLogger(__name__)
+
+
+class PageResource(resource.Resource):
+    # Each wishlist's page at /<wishlist ID>, and the first one's at /
+    # too.
+    isLeaf = True
+
+    def __init__(self, live_page, wishlists):
+        resource.Resource.__init__(self)
+        self.live_page = live_page
+        self.wishlists = wishlists
+
+    def render_GET(self, request):
+        wishlist = b'/'.join(request.postpath).decode('utf-8')
+        if not wishlist:
+            wishlist = self.wishlists[0]
+        elif wishlist not in self.wishlists:
+            return resource.NoResource().render(request)
+
+        request.setHeader(b'Content-Type', b'text/html; charset=utf-8')
+        return self.live_page.render(wishlist).encode('utf-8')
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def short_desc(self):
+        return ('Crawl the wishlist and libraries in one process and print '
+                'the page')
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_option(
+            '-w', '--wishlists', metavar='IDS',
+            help='crawl these comma-separated wishlists instead of '
+                 'WISHLIST_ID')
+        parser.add_option(
+            '-o', '--output', metavar='FILE',
+            help='write the page to FILE instead, rewriting it with the '
+                 'holdings found so far every --interval seconds; with '
+                 'several wishlists, each one\'s page is written to FILE '
+                 'with %(wishlist)s replaced by its ID')
+        parser.add_option(
+            '--interval', type='float', default=5.0,
+            help='seconds between partial pages (default: %default)')
+        parser.add_option(
+            '--port', type='int',
+            help='serve the page, as it stands, on http://127.0.0.1:PORT/ '
+                 'during the crawl and afterwards, until interrupted; each '
+                 "wishlist's is at /ID")
+
+    def run(self, args, opts):
+        if opts.interval <= 0:
+            raise UsageError('--interval must be positive')
+
+        wishlist_crawler = self.crawler_process.create_crawler('wishlist')
+        library_crawler = self.crawler_process.create_crawler('library')
+
+        # One holdings index for every wishlist, just as the library
+        # spider searches once for an item on several of them.
+        live_page = LivePage(HoldingsIndex(PREFERRED_BRANCHES))
+
+        # Each wishlist item is handed to the library spider as soon as
+        # it's scraped, so both crawls run side by side.
+        def wishlist_item_scraped(item, spider):
+            item = dict(item)
+            live_page.add_item(item)
+            library_crawler.spider.feed_item(item)
+
+        def wishlist_closed(spider):
+            library_crawler.spider.close_feed()
+
+        def library_item_scraped(item, spider):
+            live_page.add_holding(item_values(item))
+
+        wishlist_crawler.signals.connect(
+            wishlist_item_scraped, signal=signals.item_scraped)
+        wishlist_crawler.signals.connect(
+            wishlist_closed, signal=signals.spider_closed)
+        library_crawler.signals.connect(
+            library_item_scraped, signal=signals.item_scraped)
+
+        self.crawler_process.crawl(
+            library_crawler, wishlist=None, feed_open=True)
+        if opts.wishlists:
+            self.crawler_process.crawl(
+                wishlist_crawler, wishlists=opts.wishlists)
+        else:
+            self.crawler_process.crawl(wishlist_crawler)
+
+        wishlists = wishlist_crawler.spider.wishlists
+        if (len(wishlists) > 1 and (opts.output or not opts.port) and
+                '%(wishlist)s' not in (opts.output or '')):
+            raise UsageError(
+                'several wishlists are crawled; -o FILE must include '
+                '%(wishlist)s')
+
+        def write_page():
+            for wishlist in wishlists:
+                write_file(
+                    page_file(opts.output, wishlist),
+                    live_page.render(wishlist))
+
+        if opts.port:
+            reactor.listenTCP(
+                opts.port, server.Site(PageResource(live_page, wishlists)),
+                interface='127.0.0.1')
+            logger.info('Serving the page on http://127.0.0.1:%d/', opts.port)
+
+        if opts.output:
+            # LibrarySpider resolves items in wishlist order, so the top of
+            # the page fills in first.
+            partial_pages = LoopingCall(write_page)
+            partial_pages.start(opts.interval, now=False)
+
+        self.crawler_process.start(stop_after_crawl=not opts.port)
+
+        if opts.output:
+            partial_pages.stop()
+            write_page()
+        elif not opts.port:
+            print(live_page.render(wishlists[0]))
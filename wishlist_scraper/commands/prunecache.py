@@ -0,0 +1,16 @@
+from scrapy.commands import ScrapyCommand
+
+from ..httpcache import SqliteCacheStorage
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def short_desc(self):
+        return 'Remove expired responses from the HTTP cache'
+
+    def run(self, args, opts):
+        storage = SqliteCacheStorage(self.settings)
+        for dbpath in storage.db_paths():
+            pruned = storage.prune(dbpath)
+            print('{}: pruned {} responses'.format(dbpath, pruned))
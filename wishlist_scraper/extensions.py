@@ -0,0 +1,256 @@
+import json
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from .utils import write_file
+
+# Upper bounds, in seconds, of the download latency histogram's buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf'))
+
+PROMETHEUS_PREFIX = 'wishlist_scraper'
+
+
+def request_backend(request):
+    # LibrarySpider gives each catalog its own download slot; everything
+    # else is grouped by API or host, or by scheme for data: requests.
+    if 'download_slot' in request.meta:
+        return request.meta['download_slot']
+    if 'amazon_api' in request.meta:
+        return 'amazon_api'
+    url = urlparse(request.url)
+    return url.hostname or url.scheme
+
+
+def request_callback(request):
+    return getattr(request.callback, '__name__', None) or 'parse'
+
+
+class BackendMetrics(object):
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.responses = 0
+        self.http_cache_hits = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe_latency(self, latency):
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_buckets[i] += 1
+                break
+
+    def report(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            cumulative += count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = (
+                cumulative)
+
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'responses': self.responses,
+            'http_cache_hits': self.http_cache_hits,
+            'http_cache_hit_ratio': (
+                self.http_cache_hits / self.responses
+                if self.responses else None),
+            'latency': {
+                'count': cumulative,
+                'sum': self.latency_sum,
+                'buckets': buckets,
+            },
+        }
+
+
+class CallbackMetrics(object):
+    def __init__(self):
+        self.responses = 0
+        self.parse_cpu_seconds = 0.0
+        self.items = 0
+        self.requests = 0
+        self.errors = 0
+
+    def report(self):
+        return {
+            'responses': self.responses,
+            'parse_cpu_seconds': self.parse_cpu_seconds,
+            'items': self.items,
+            'requests': self.requests,
+            'errors': self.errors,
+        }
+
+
+class CrawlInstrumentation(object):
+    # Per-backend request, retry, latency and HTTP cache figures and
+    # per-callback parse CPU time and output counts, written when the
+    # spider closes as a JSON report and a Prometheus textfile (for
+    # node_exporter's textfile collector). Parse timing comes from
+    # InstrumentationMiddleware. Every update is a couple of dict lookups
+    # and additions, cheap enough to leave on.
+
+    def __init__(self, stats, json_path, prometheus_path):
+        self.stats = stats
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.backends = defaultdict(BackendMetrics)
+        self.callbacks = defaultdict(CallbackMetrics)
+        self.started_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('INSTRUMENTATION_ENABLED'):
+            raise NotConfigured
+
+        extension = cls(
+            crawler.stats,
+            settings.get('INSTRUMENTATION_JSON_FILE'),
+            settings.get('INSTRUMENTATION_PROMETHEUS_FILE'))
+        crawler.signals.connect(
+            extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(
+            extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(
+            extension.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(
+            extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(
+            extension.spider_error, signal=signals.spider_error)
+        return extension
+
+    def spider_opened(self, spider):
+        self.started_at = time.time()
+
+    def request_scheduled(self, request, spider):
+        backend = self.backends[request_backend(request)]
+        backend.requests += 1
+        if request.meta.get('retry_times'):
+            backend.retries += 1
+
+    def response_received(self, response, request, spider):
+        backend = self.backends[request_backend(request)]
+        backend.responses += 1
+        if 'cached' in response.flags:
+            backend.http_cache_hits += 1
+        elif 'download_latency' in request.meta:
+            backend.observe_latency(request.meta['download_latency'])
+
+    def spider_error(self, failure, response, spider):
+        self.callbacks[request_callback(response.request)].errors += 1
+
+    def spider_closed(self, spider, reason):
+        report = self.report(spider, reason)
+        if self.json_path:
+            write_file(self.json_path % {'name': spider.name},
+                       json.dumps(report, indent=2, sort_keys=True))
+        if self.prometheus_path:
+            # Renamed into place, so node_exporter never reads half a file.
+            write_file(self.prometheus_path % {'name': spider.name},
+                       self.prometheus(report))
+
+    def report(self, spider, reason):
+        get_stat = lambda key: self.stats.get_value(key, 0, spider=spider)
+
+        amazon_api_cache_hits = get_stat('amazon_api_cache/hit')
+        amazon_api_cache_misses = get_stat('amazon_api_cache/miss')
+        amazon_api_cache_lookups = (
+            amazon_api_cache_hits + amazon_api_cache_misses)
+
+        finished_at = time.time()
+        return {
+            'spider': spider.name,
+            'finish_reason': reason,
+            'started_at': self.started_at,
+            'finished_at': finished_at,
+            'elapsed_seconds': finished_at - self.started_at,
+            'backends': {
+                name: backend.report()
+                for name, backend
+                in self.backends.items()
+            },
+            'callbacks': {
+                name: callback.report()
+                for name, callback
+                in self.callbacks.items()
+            },
+            'amazon_api': {
+                'cache_hits': amazon_api_cache_hits,
+                'cache_misses': amazon_api_cache_misses,
+                # Lookups shared with another wishlist's, already in flight.
+                'joined': get_stat('amazon_api_cache/joined'),
+                'cache_hit_ratio': (
+                    amazon_api_cache_hits / amazon_api_cache_lookups
+                    if amazon_api_cache_lookups else None),
+                'retries': get_stat('amazon_api/retries'),
+            },
+        }
+
+    @classmethod
+    def prometheus(cls, report):
+        lines = []
+
+        def metric(name, metric_type, samples):
+            name = '{}_{}'.format(PROMETHEUS_PREFIX, name)
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for suffix, labels, value in samples:
+                labels = dict(labels, spider=report['spider'])
+                lines.append('{}{}{{{}}} {}'.format(
+                    name, suffix,
+                    ','.join(
+                        '{}="{}"'.format(key, labels[key])
+                        for key in sorted(labels)),
+                    value))
+
+        backends = sorted(report['backends'].items())
+        callbacks = sorted(report['callbacks'].items())
+        for name in ('requests', 'retries', 'responses', 'http_cache_hits'):
+            metric('{}_total'.format(name), 'counter', [
+                ('', {'backend': backend}, values[name])
+                for backend, values in backends
+            ])
+
+        latency_samples = []
+        for backend, values in backends:
+            latency = values['latency']
+            for bound, count in latency['buckets'].items():
+                latency_samples.append(
+                    ('_bucket', {'backend': backend, 'le': bound}, count))
+            latency_samples.append(
+                ('_sum', {'backend': backend}, latency['sum']))
+            latency_samples.append(
+                ('_count', {'backend': backend}, latency['count']))
+        metric('download_latency_seconds', 'histogram', latency_samples)
+
+        for name, metric_name in (
+                ('responses', 'callback_responses_total'),
+                ('parse_cpu_seconds', 'parse_cpu_seconds_total'),
+                ('items', 'items_total'),
+                ('requests', 'callback_requests_total'),
+                ('errors', 'callback_errors_total')):
+            metric(metric_name, 'counter', [
+                ('', {'callback': callback}, values[name])
+                for callback, values in callbacks
+            ])
+
+        amazon_api = report['amazon_api']
+        metric('amazon_api_cache_hits_total', 'counter', [
+            ('', {}, amazon_api['cache_hits'])])
+        metric('amazon_api_cache_misses_total', 'counter', [
+            ('', {}, amazon_api['cache_misses'])])
+        metric('amazon_api_joined_total', 'counter', [
+            ('', {}, amazon_api['joined'])])
+        metric('amazon_api_retries_total', 'counter', [
+            ('', {}, amazon_api['retries'])])
+        metric('crawl_duration_seconds', 'gauge', [
+            ('', {}, report['elapsed_seconds'])])
+        metric('crawl_finished_timestamp_seconds', 'gauge', [
+            ('', {}, report['finished_at'])])
+
+        return '\n'.join(lines) + '\n'
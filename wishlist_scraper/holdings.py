@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+
+class HoldingsIndex(object):
+    def __init__(self, preferred_branches, holdings=()):
+        self.preferred_branches = preferred_branches
+
+        # isbn -> library -> branch -> [holding, ...]
+        self._holdings = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(list)))
+        # isbn -> branches across every library.
+        self._branches = defaultdict(set)
+        # (isbn, library) -> branches with at least one available copy.
+        self._available = defaultdict(set)
+        # (isbn, library) -> preferred branches owning the item.
+        self._preferred = defaultdict(set)
+
+        self.update(holdings)
+
+    def add(self, holding):
+        if 'digital_url' not in holding and 'call_num' not in holding:
+            return
+
+        isbn = holding['isbn']
+        library = holding['library']
+        branch = holding['branch']
+
+        self._holdings[isbn][library][branch].append(holding)
+        self._branches[isbn].add(branch)
+        if holding.get('available'):
+            self._available[isbn, library].add(branch)
+        if branch in self.preferred_branches.get(library, ()):
+            self._preferred[isbn, library].add(branch)
+
+    def update(self, holdings):
+        for holding in holdings:
+            self.add(holding)
+
+    def __contains__(self, isbn):
+        return isbn in self._holdings
+
+    def get_holdings(self, isbn, library=None, branches=None):
+        if isbn not in self._holdings:
+            return []
+
+        by_library = self._holdings[isbn]
+        libraries = [library] if library else list(by_library)
+
+        holdings = []
+        for library in libraries:
+            if library not in by_library:
+                continue
+            for branch, branch_holdings in by_library[library].items():
+                if branches and branch not in branches:
+                    continue
+                holdings.extend(branch_holdings)
+        return holdings
+
+    def best_branches(self, isbn, library):
+        available = self._available.get((isbn, library), frozenset())
+        preferred = self._preferred.get((isbn, library))
+
+        if not preferred:
+            # If this item isn't owned by any of our preferred branches,
+            # fall back to listing all branches that have it available.
+            return frozenset(available)
+
+        if preferred & available:
+            return frozenset(preferred)
+
+        return frozenset(
+            available |
+            (self._branches[isbn] & self.preferred_branches[library]))
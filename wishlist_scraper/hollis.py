@@ -0,0 +1,141 @@
+import re
+
+from twisted.internet import reactor
+
+SEARCH_URL = re.compile(r'^(https?://[^/]+)/F/\?(func=find-.*)$')
+SESSION_SEARCH_URL = re.compile(r'^https?://[^/]+/F/[^/?]+\?func=find-')
+SESSION_URL = re.compile(r'^(https?://[^/:]+)(?::\d+)?/F/([^/?]+)\?')
+
+
+class HollisHandshake(object):
+    # Shared by a Hollis search's chain of handshake requests. `released`
+    # once it no longer counts against HOLLIS_SESSIONS, and `session` once
+    # the session it ended up with has been registered, which may be
+    # after it was released for taking too long.
+
+    def __init__(self):
+        self.released = False
+        self.session = None
+
+
+class HollisSessions(object):
+    # Hollis (Aleph) only hands out a session, as the /F/<session> prefix
+    # of its URLs, after a JavaScript-driven SSO handshake. Rather than
+    # going through that for every search, up to max_sessions sessions are
+    # kept, each established by some search's own handshake, and
+    # HollisSessionMiddleware rewrites other searches into them in turn,
+    # landing on their results straight away. Aleph numbers each search's
+    # result set, so searches sharing a session don't disturb each other's
+    # follow-ups.
+    #
+    # LibrarySpider passes its searches through hold() before scheduling
+    # them. While every handshake slot is taken and no session is ready,
+    # they're held here rather than in the downloader, where they'd take
+    # up the CONCURRENT_REQUESTS the handshakes' own requests need. A
+    # handshake that fails or stalls for handshake_timeout hands its slot
+    # to a held search; if its session turns up later, it's still kept.
+
+    def __init__(self, crawler, max_sessions, handshake_timeout):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_sessions = max_sessions
+        self.handshake_timeout = handshake_timeout
+        self.sessions = []
+        self.next_session = 0
+        self.handshakes = 0
+        self.held = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            settings.getint('HOLLIS_SESSIONS'),
+            settings.getfloat('HOLLIS_HANDSHAKE_TIMEOUT'))
+
+    def hold(self, request, spider):
+        # Whether `request` is held, to be scheduled once there's a session
+        # or a handshake slot for it; if not, it's to be scheduled now.
+        if not SEARCH_URL.match(request.url) or self.sessions:
+            return False
+
+        if self.handshakes < self.max_sessions:
+            self.start_handshake(request, spider)
+            return False
+
+        self.held.append(request)
+        self.stats.inc_value('hollis/held_searches', spider=spider)
+        return True
+
+    def flush(self, spider):
+        # Schedules every held search, e.g. when the spider would otherwise
+        # close with them still held. Those without a session go through
+        # a handshake of their own. Whether there were any.
+        held = self.held
+        self.held = []
+        for request in held:
+            if not self.sessions:
+                self.start_handshake(request, spider)
+            self.crawler.engine.crawl(request, spider)
+        return bool(held)
+
+    def start_handshake(self, request, spider):
+        # Counted even past max_sessions, for a search that finds no
+        # session in the downloader, e.g. because its own had expired.
+        handshake = HollisHandshake()
+        self.handshakes += 1
+        reactor.callLater(
+            self.handshake_timeout, self.release, handshake, spider)
+        request.meta['hls_handshake'] = handshake
+        request.meta['dont_cache'] = True
+
+    def session(self):
+        # The session for the next search, if there is one.
+        if not self.sessions:
+            return None
+
+        session = self.sessions[self.next_session % len(self.sessions)]
+        self.next_session += 1
+        return session
+
+    def add_session(self, handshake, session, spider):
+        if handshake.session is not None:
+            return
+        handshake.session = session
+
+        if (session not in self.sessions and
+                len(self.sessions) < self.max_sessions):
+            self.sessions.append(session)
+            self.stats.inc_value('hollis/sessions', spider=spider)
+        if not handshake.released:
+            handshake.released = True
+            self.handshakes -= 1
+        self._wake(spider)
+
+    def release(self, handshake, spider):
+        # Gives up the handshake's slot, after it failed or stalled.
+        if handshake.released:
+            return
+        handshake.released = True
+        self.handshakes -= 1
+        self._wake(spider)
+
+    def expire(self, session, spider):
+        if session in self.sessions:
+            self.sessions.remove(session)
+            self.stats.inc_value('hollis/expired_sessions', spider=spider)
+
+    def _wake(self, spider):
+        # Every held search once there's a session; otherwise the first
+        # in wishlist order for each free handshake slot.
+        while self.held:
+            if self.sessions:
+                self.flush(spider)
+                return
+            if self.handshakes >= self.max_sessions:
+                return
+
+            request = max(self.held, key=lambda request: request.priority)
+            self.held.remove(request)
+            self.start_handshake(request, spider)
+            self.crawler.engine.crawl(request, spider)
@@ -0,0 +1,133 @@
+import glob
+import logging
+import os
+import pickle
+import sqlite3
+import zlib
+from time import time
+from urllib.parse import urlparse
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from scrapy.utils.request import request_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCacheStorage(object):
+    # HTTPCACHE_STORAGE backend keeping one SQLite file per spider, with
+    # zlib-compressed responses indexed by request fingerprint, instead of
+    # a directory of small files per request.
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.domain_expiration_secs = settings.getdict(
+            'HTTPCACHE_DOMAIN_EXPIRATION_SECS')
+        self.compression_level = settings.getint(
+            'HTTPCACHE_COMPRESSION_LEVEL')
+        self.commit_interval = settings.getint('HTTPCACHE_COMMIT_INTERVAL')
+        self.db = None
+        self.uncommitted = 0
+
+    @classmethod
+    def _connect(cls, path):
+        db = sqlite3.connect(path)
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('PRAGMA synchronous = NORMAL')
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                fingerprint TEXT PRIMARY KEY,
+                domain TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                data BLOB NOT NULL
+            )
+        ''')
+        db.execute('''
+            CREATE INDEX IF NOT EXISTS responses_domain_stored_at
+            ON responses (domain, stored_at)
+        ''')
+        return db
+
+    def db_paths(self):
+        return sorted(glob.glob(os.path.join(self.cachedir, '*.sqlite')))
+
+    def open_spider(self, spider):
+        dbpath = os.path.join(self.cachedir, '{}.sqlite'.format(spider.name))
+        self.db = self._connect(dbpath)
+
+        logger.debug(
+            'Using SQLite cache storage in %(cachepath)s',
+            {'cachepath': dbpath}, extra={'spider': spider})
+
+    def close_spider(self, spider):
+        self.db.commit()
+        self.db.close()
+
+    def expiration_secs_for(self, domain):
+        return self.domain_expiration_secs.get(domain, self.expiration_secs)
+
+    def retrieve_response(self, spider, request):
+        domain = urlparse(request.url).hostname or ''
+        row = self.db.execute(
+            'SELECT stored_at, data FROM responses WHERE fingerprint = ?',
+            (request_fingerprint(request),)).fetchone()
+        if row is None:
+            return  # not cached
+
+        stored_at, data = row
+        if 0 < self.expiration_secs_for(domain) < time() - stored_at:
+            return  # expired
+
+        data = pickle.loads(zlib.decompress(data))
+        url = data['url']
+        status = data['status']
+        headers = Headers(data['headers'])
+        body = data['body']
+        respcls = responsetypes.from_args(headers=headers, url=url)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        data = {
+            'status': response.status,
+            'url': response.url,
+            'headers': dict(response.headers),
+            'body': response.body,
+        }
+        self.db.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+            (request_fingerprint(request),
+             urlparse(request.url).hostname or '',
+             time(),
+             zlib.compress(
+                 pickle.dumps(data, protocol=2), self.compression_level)))
+
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def prune(self, dbpath):
+        db = self._connect(dbpath)
+        now = time()
+
+        pruned = 0
+        domains = [
+            domain
+            for domain,
+            in db.execute('SELECT DISTINCT domain FROM responses')
+        ]
+        for domain in domains:
+            expiration_secs = self.expiration_secs_for(domain)
+            if expiration_secs <= 0:
+                continue
+            pruned += db.execute(
+                'DELETE FROM responses WHERE domain = ? AND stored_at < ?',
+                (domain, now - expiration_secs)).rowcount
+        db.commit()
+
+        db.execute('VACUUM')
+        db.close()
+        return pruned
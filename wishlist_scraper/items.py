@@ -1,9 +1,14 @@
 import re
+from dataclasses import dataclass
+from typing import Optional
 
+from itemadapter import ItemAdapter
 from scrapy.loader.processors import (
     Compose, Join, MapCompose, TakeFirst)
 from scrapy.item import Item, Field
 
+from .utils import isbn_variants
+
 
 class WishlistItemImage(Item):
     url = Field(output_processor=TakeFirst())
@@ -32,7 +37,13 @@ class WishlistItemAmazonRatingOverview(Item):
 
 
 class WishlistItem(Item):
+    # The ID of the wishlist the item is on; an item on several wishlists
+    # is scraped once for each.
+    wishlist = Field()
     isbn = Field()
+    # The EISBN and ISBN, each in its ISBN-10 and ISBN-13 form, for
+    # LibrarySpider's catalog searches.
+    isbns = Field(output_processor=isbn_variants)
     format = Field()
     title = Field()
     by = Field(output_processor=TakeFirst())
@@ -43,34 +54,38 @@ class WishlistItem(Item):
     sort_key = Field(output_processor=Join('/'))
 
 
-class LibraryAvailability(Item):
-    def parse_available(value):
-        return value.lower() in ['true', 'available', 'in', 'not checked out']
+def parse_available(value):
+    return value.lower() in ['true', 'available', 'in', 'not checked out']
+
+
+def parse_call_num(value):
+    return value.replace(u'\xa0', ' ')
+
 
-    def parse_call_num(value):
-        return value.replace(u'\xa0', ' ')
+def parse_copies(value):
+    if not value:
+        return '1'
 
-    def parse_copies(value):
-        if not value:
-            return '1'
+    matches = re.search(r'Holds: (\d+) on (\d+)', value)
+    if not matches:
+        return '1'
 
-        matches = re.search(r'Holds: (\d+) on (\d+)', value)
-        if not matches:
-            return '1'
+    return matches.group(2)
 
-        return matches.group(2)
 
-    def parse_holds(value):
-        if not value:
-            return
+def parse_holds(value):
+    if not value:
+        return
 
-        matches = re.search(r'Holds: (\d+) on (\d+)', value)
-        if not matches:
-            return
+    matches = re.search(r'Holds: (\d+) on (\d+)', value)
+    if not matches:
+        return
 
-        return matches.group(1)
+    return matches.group(1)
 
-    item = Field(output_processor=TakeFirst())
+
+class LibraryAvailability(Item):
+    isbn = Field(output_processor=TakeFirst())
     library = Field()
     catalog_url = Field()
     branch = Field()
@@ -91,3 +106,39 @@ class LibraryAvailability(Item):
         serializer=int,
         output_processor=Compose(
             MapCompose(lambda s: s.strip()), TakeFirst(), parse_holds))
+
+
+@dataclass(slots=True)
+class Holding(object):
+    # A LibraryAvailability without the loader and per-item dict overhead,
+    # for parsers that turn catalog tables into many rows at a time.
+    # `available`, `copies` and `holds` are typed when it's created, with
+    # the defaults LibraryAvailabilityPipeline fills in for loaded items.
+    # Unset fields are None; item_values() leaves them out, as they are
+    # from a loaded LibraryAvailability.
+
+    isbn: Optional[str] = None
+    library: Optional[str] = None
+    catalog_url: Optional[str] = None
+    branch: Optional[str] = None
+    collection: Optional[str] = None
+    call_num: Optional[str] = None
+    digital_url: Optional[str] = None
+    copies: int = 1
+    available: bool = False
+    holds: int = 0
+
+    def __post_init__(self):
+        self.copies = 1 if self.copies is None else int(self.copies)
+        self.available = bool(self.available)
+        self.holds = 0 if self.holds is None else int(self.holds)
+
+
+def item_values(item):
+    # The item's fields as a dict, leaving out those that aren't set.
+    return {
+        key: value
+        for key, value
+        in ItemAdapter(item).items()
+        if value is not None
+    }
@@ -0,0 +1,123 @@
+import re
+
+
+STRING = r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\''
+NUMBER = (
+    r'(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)'
+    r'(?![\w$.])')
+
+COMMENT = r'//[^\n]*|/\*.*?\*/'
+
+STRING_RE = re.compile(STRING)
+# Strings, comments and regular expression literals are matched so a `var`
+# or quote inside one is skipped. A slash that isn't a comment may be
+# either a regular expression or a division; see _regex_end().
+TOKEN_RE = re.compile(
+    r'(?P<string>{})|(?P<comment>{})|(?P<slash>/)|(?<![\w$.])var\s'
+    .format(STRING, COMMENT), re.DOTALL)
+COMMENT_RE = re.compile(COMMENT, re.DOTALL)
+REGEX_RE = re.compile(
+    r'/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[\w$]*')
+DECLARATOR_RE = re.compile(
+    r'\s*(?P<name>[A-Za-z_$][\w$]*)\s*'
+    r'(?:=\s*(?:(?P<string>{})|(?P<number>{}))?)?'.format(STRING, NUMBER))
+LITERAL_END_RE = re.compile(r'[ \t]*(?:(?P<comma>,)|[;}\n]|$)')
+
+# What a regular expression literal can follow, where a division can't:
+# punctuation other than a closing bracket, and these keywords.
+REGEX_PRECEDING_CHARS = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_PRECEDING_WORDS = {
+    'case', 'delete', 'do', 'else', 'in', 'instanceof', 'new', 'return',
+    'throw', 'typeof', 'void', 'yield',
+}
+
+
+def _regex_end(script, pos):
+    # The end of the regular expression literal starting with the slash at
+    # `pos`, or None if the slash is a division.
+    start = pos
+    while start > 0 and script[start - 1].isspace():
+        start -= 1
+    if start > 0 and script[start - 1] not in REGEX_PRECEDING_CHARS:
+        end = start
+        while start > 0 and (
+                script[start - 1].isalnum() or script[start - 1] in '_$'):
+            start -= 1
+        if script[start:end] not in REGEX_PRECEDING_WORDS:
+            return None
+
+    regex = REGEX_RE.match(script, pos)
+    return regex.end() if regex else None
+
+
+def _initializer_end(script, pos):
+    # Find the comma or semicolon ending a non-literal initializer, and
+    # whether another declarator follows it.
+    depth = 0
+    while pos < len(script):
+        char = script[pos]
+        if char in '"\'':
+            string = STRING_RE.match(script, pos)
+            pos = string.end() if string else pos + 1
+            continue
+        if char == '/':
+            comment = COMMENT_RE.match(script, pos)
+            pos = comment.end() if comment else (
+                _regex_end(script, pos) or pos + 1)
+            continue
+
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and char in ',;':
+            return pos + 1, char == ','
+        pos += 1
+
+    return pos, False
+
+
+def extract_js_vars(script):
+    # The `var name = "string"` and `var name = 123` declarations in a
+    # script, nested ones included, as {name: value}. Values are the raw
+    # source text, minus the quotes around strings; declarations with any
+    # other initializer are ignored.
+    js_vars = {}
+
+    pos = 0
+    while True:
+        token = TOKEN_RE.search(script, pos)
+        if not token:
+            return js_vars
+        pos = token.end()
+        if token.lastgroup == 'slash':
+            pos = _regex_end(script, token.start()) or pos
+            continue
+        if token.lastgroup:
+            # A string or comment.
+            continue
+
+        more = True
+        while more:
+            declarator = DECLARATOR_RE.match(script, pos)
+            if not declarator:
+                break
+            pos = declarator.end()
+
+            string = declarator.group('string')
+            number = declarator.group('number')
+            literal_end = LITERAL_END_RE.match(script, pos)
+            if (string or number) and literal_end:
+                js_vars[declarator.group('name')] = (
+                    string[1:-1] if string else number)
+                pos = literal_end.end()
+                more = bool(literal_end.group('comma'))
+                continue
+
+            # Pick up declarations nested in the initializer, e.g. inside
+            # a function expression.
+            start = pos
+            pos, more = _initializer_end(script, pos)
+            js_vars.update(extract_js_vars(script[start:pos]))
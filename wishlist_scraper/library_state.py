@@ -0,0 +1,93 @@
+import hashlib
+import json
+import time
+
+
+class LibraryLookup(object):
+    # Tracks one (ISBN, library) search across its follow-up requests so
+    # LibraryStateMiddleware knows when all of its holdings have arrived.
+
+    def __init__(self, isbn, library):
+        self.isbn = isbn
+        self.library = library
+        self.pending = 1
+        self.failed = False
+        self.holdings = []
+
+
+class LibraryState(object):
+    # Last known holdings per (ISBN, library), with when they were fetched
+    # and when they last changed, kept in a gdbm file as JSON records.
+
+    # Bumped whenever the stored holdings' shape changes; records written
+    # with any other version are ignored and refetched.
+    version = 2
+
+    def __init__(self, path, max_age, stable_after, stable_max_age):
+        # Imported here, so that loading the spiders doesn't need it.
+        import _gdbm
+        self.db = _gdbm.open(path, 'c')
+        self.max_age = max_age
+        self.stable_after = stable_after
+        self.stable_max_age = stable_max_age
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get('LIBRARY_STATE_FILE'),
+            settings.getint('LIBRARY_STATE_MAX_AGE'),
+            settings.getint('LIBRARY_STATE_STABLE_AFTER'),
+            settings.getint('LIBRARY_STATE_STABLE_MAX_AGE'))
+
+    @classmethod
+    def _key(cls, isbn, library):
+        return '{}:{}'.format(isbn, library)
+
+    @classmethod
+    def _hash(cls, holdings):
+        return hashlib.sha1(
+            '\n'.join(sorted(
+                json.dumps(holding, sort_keys=True)
+                for holding
+                in holdings
+            )).encode('utf-8')
+        ).hexdigest()
+
+    def get(self, isbn, library):
+        key = self._key(isbn, library)
+        if key not in self.db:
+            return None
+
+        record = json.loads(self.db[key].decode('utf-8'))
+        if record.get('version') != self.version:
+            return None
+        return record
+
+    def is_fresh(self, record):
+        now = time.time()
+
+        # Holdings that haven't changed in a while are rechecked less often.
+        max_age = self.max_age
+        if now - record['changed_at'] > self.stable_after:
+            max_age = self.stable_max_age
+
+        return now - record['fetched_at'] < max_age
+
+    def update(self, isbn, library, holdings):
+        now = time.time()
+        record = self.get(isbn, library)
+        digest = self._hash(holdings)
+
+        changed = record is None or record['hash'] != digest
+        self.db[self._key(isbn, library)] = json.dumps({
+            'version': self.version,
+            'fetched_at': now,
+            'changed_at': now if changed else record['changed_at'],
+            'hash': digest,
+            'holdings': holdings,
+        }).encode('utf-8')
+
+        return changed
+
+    def close(self):
+        self.db.close()
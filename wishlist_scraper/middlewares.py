@@ -0,0 +1,476 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, XmlResponse
+from twisted.internet import defer, reactor, threads
+from twisted.internet.task import deferLater
+from twisted.python.threadpool import ThreadPool
+
+from . import hollis
+from .extensions import CrawlInstrumentation, request_callback
+from .items import item_values
+from .offload import parse_offloaded
+
+
+logger = logging.getLogger(__name__)
+
+
+class AmazonProductApiMiddleware(object):
+    # Requests carrying an `amazon_api` meta dict are answered by calling
+    # the spider's bottlenose client on a bounded thread pool, so a slow
+    # or throttled Product Advertising API call never blocks the reactor.
+
+    def __init__(self, stats, max_threads, max_retries, backoff,
+                 max_backoff):
+        self.stats = stats
+        self.threadpool = ThreadPool(
+            minthreads=0, maxthreads=max_threads, name='amazon-api')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        middleware = cls(
+            crawler.stats,
+            settings.getint('AMAZON_API_THREADS'),
+            settings.getint('AMAZON_API_MAX_RETRIES'),
+            settings.getfloat('AMAZON_API_RETRY_BACKOFF'),
+            settings.getfloat('AMAZON_API_RETRY_MAX_BACKOFF'))
+        crawler.signals.connect(
+            middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(
+            middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.threadpool.start()
+
+    def spider_closed(self, spider):
+        self.threadpool.stop()
+
+    def process_request(self, request, spider):
+        if 'amazon_api' not in request.meta:
+            return
+
+        return self._call(request, spider, 0)
+
+    def _call(self, request, spider, retries):
+        params = dict(request.meta['amazon_api'])
+        operation = getattr(spider.amazon, params.pop('Operation'))
+
+        d = threads.deferToThreadPool(
+            reactor, self.threadpool, operation, **params)
+        d.addCallback(self._response, request, time.time())
+        d.addErrback(self._retry, request, spider, retries)
+        return d
+
+    def _response(self, body, request, started_at):
+        # Reported like a download's latency, for CrawlInstrumentation.
+        request.meta['download_latency'] = time.time() - started_at
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        return XmlResponse(request.url, body=body, request=request)
+
+    def _retry(self, failure, request, spider, retries):
+        failure.trap(HTTPError)
+        if failure.value.code != 503 or retries >= self.max_retries:
+            return failure
+
+        # Back off exponentially on throttling without tying up the
+        # reactor or a pool thread while we wait.
+        delay = min(self.backoff * 2 ** retries, self.max_backoff)
+        self.stats.inc_value('amazon_api/retries', spider=spider)
+        logger.debug(
+            'Amazon API throttled %s, retrying in %.1fs', request, delay)
+        return deferLater(
+            reactor, delay, self._call, request, spider, retries + 1)
+
+
+class ParseOffloadMiddleware(object):
+    # Parses the responses of spider callbacks marked offload.offloadable
+    # in a pool of PARSE_OFFLOAD_PROCESSES worker processes, so the
+    # catalogs' holdings pages are parsed on every core and the reactor
+    # thread is left to scheduling and I/O. Each response is held back
+    # until its holdings are back, which the callback then yields as they
+    # are. A response the worker fails on is parsed by the callback as
+    # usual.
+
+    def __init__(self, stats, processes):
+        if processes <= 0:
+            raise NotConfigured
+        self.stats = stats
+        self.processes = processes
+        self.executor = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(
+            crawler.stats, crawler.settings.getint('PARSE_OFFLOAD_PROCESSES'))
+        crawler.signals.connect(
+            middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(
+            middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        # Spawned rather than forked, as the crawl process has threads of
+        # its own, e.g. AmazonProductApiMiddleware's.
+        self.executor = ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def spider_closed(self, spider):
+        self.executor.shutdown(wait=False)
+
+    def process_response(self, request, response, spider):
+        meta_keys = getattr(request.callback, 'offload_meta', None)
+        if meta_keys is None or response.status != 200:
+            return response
+
+        # Workers look the callback up on the class defining it, as a
+        # subclass may not be importable from them.
+        name = request.callback.__name__
+        spider_class = next(
+            cls for cls in type(spider).__mro__ if name in vars(cls))
+        future = self.executor.submit(
+            parse_offloaded, spider_class, name, type(response),
+            response.url, response.body, response.encoding,
+            {key: request.meta[key] for key in meta_keys
+             if key in request.meta})
+
+        d = defer.Deferred()
+        future.add_done_callback(
+            lambda future: reactor.callFromThread(d.callback, future))
+        d.addCallback(self._parsed, request, response, spider)
+        return d
+
+    def _parsed(self, future, request, response, spider):
+        try:
+            records = future.result()
+        except Exception:
+            logger.exception(
+                'Parsing %s in a worker process failed', response,
+                extra={'spider': spider})
+            self.stats.inc_value('parse_offload/failed', spider=spider)
+            return response
+
+        self.stats.inc_value('parse_offload/parsed', spider=spider)
+        request.meta['offloaded_holdings'] = records
+        return response
+
+
+class CatalogConcurrencyMiddleware(object):
+    # AIMD concurrency control for the download slots named in
+    # CATALOG_CONCURRENCY_MAX (LibrarySpider routes each catalog backend's
+    # requests through a slot of the same name). Fast, successful responses
+    # grow a slot's concurrency by one per window of requests; throttling,
+    # server errors, slow responses and download errors halve it, and once
+    # a slot is down to one request its download delay is doubled instead.
+
+    def __init__(self, crawler, max_concurrency, target_latency, min_delay,
+                 max_delay):
+        self.crawler = crawler
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.windows = {}
+        self.last_decrease = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            settings.getdict('CATALOG_CONCURRENCY_MAX'),
+            settings.getfloat('CATALOG_CONCURRENCY_TARGET_LATENCY'),
+            settings.getfloat('DOWNLOAD_DELAY'),
+            settings.getfloat('CATALOG_CONCURRENCY_MAX_DELAY'))
+
+    def _slot(self, request):
+        key = request.meta.get('download_slot')
+        if key not in self.max_concurrency:
+            return None, None
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def process_response(self, request, response, spider):
+        key, slot = self._slot(request)
+        if slot is None or 'cached' in response.flags:
+            return response
+
+        latency = request.meta.get('download_latency', 0)
+        if response.status == 429 or response.status >= 500:
+            self._decrease(key, slot, latency)
+        elif latency > self.target_latency:
+            self._decrease(key, slot, latency)
+        else:
+            self._increase(key, slot)
+
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot = self._slot(request)
+        if slot is not None:
+            self._decrease(
+                key, slot, request.meta.get('download_latency', 0))
+
+    def _increase(self, key, slot):
+        window = self.windows.get(key, float(slot.concurrency))
+        window = min(window + 1.0 / window, self.max_concurrency[key])
+        self.windows[key] = window
+
+        slot.concurrency = int(window)
+        slot.delay = max(slot.delay / 2, self.min_delay)
+
+    def _decrease(self, key, slot, latency):
+        # Responses already in flight when we backed off report the same
+        # congestion; only react once per round trip.
+        now = time.time()
+        if now - self.last_decrease.get(key, 0) < max(latency, 1):
+            return
+        self.last_decrease[key] = now
+
+        window = self.windows.get(key, float(slot.concurrency))
+        if window >= 2:
+            window /= 2
+        else:
+            slot.delay = min(max(slot.delay * 2, 1.0), self.max_delay)
+        self.windows[key] = window
+
+        slot.concurrency = int(window)
+        logger.debug(
+            'Backing off %s: concurrency %d, delay %.1fs',
+            key, slot.concurrency, slot.delay)
+
+
+class HollisSessionMiddleware(object):
+    # Rewrites LibrarySpider's Hollis searches into the sessions its
+    # HollisSessions keeps, and registers the session each handshake ends
+    # up with. A search that finds no session here, e.g. a title search
+    # after an ISBN miss, goes through a handshake of its own; one bounced
+    # back to the handshake by an expired session drops that session and
+    # goes around again.
+    #
+    # It must run before HttpCacheMiddleware, which mustn't answer a
+    # handshake with an old session.
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getint('HOLLIS_SESSIONS'):
+            raise NotConfigured
+        return cls(crawler.stats)
+
+    def process_request(self, request, spider):
+        sessions = getattr(spider, 'hollis_sessions', None)
+        if sessions is None:
+            return
+        match = hollis.SEARCH_URL.match(request.url)
+        if not match:
+            return
+
+        handshake = request.meta.get('hls_handshake')
+        if handshake is not None and not handshake.released:
+            return
+
+        session = sessions.session()
+        if session is None:
+            sessions.start_handshake(request, spider)
+            return
+
+        self.stats.inc_value('hollis/session_searches', spider=spider)
+        return request.replace(
+            url='{}/F/{}?{}'.format(match.group(1), session, match.group(2)),
+            meta=dict(request.meta, hls_session=session),
+            dont_filter=True)
+
+    def process_response(self, request, response, spider):
+        sessions = getattr(spider, 'hollis_sessions', None)
+        if sessions is None:
+            return response
+
+        session = request.meta.get('hls_session')
+        if (session is not None and
+                hollis.SESSION_SEARCH_URL.match(request.url) and
+                b'func=sso' in response.body):
+            sessions.expire(session, spider)
+            return self._expired(request)
+
+        handshake = request.meta.get('hls_handshake')
+        if handshake is None or handshake.session is not None:
+            return response
+
+        match = hollis.SESSION_URL.match(response.url)
+        if match:
+            sessions.add_session(handshake, match.group(2), spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        sessions = getattr(spider, 'hollis_sessions', None)
+        handshake = request.meta.get('hls_handshake')
+        if sessions is not None and handshake is not None:
+            sessions.release(handshake, spider)
+
+    def _expired(self, request):
+        match = hollis.SESSION_URL.match(request.url)
+        meta = dict(request.meta)
+        del meta['hls_session']
+        return request.replace(
+            url=urljoin(
+                match.group(1), '/F/?{}'.format(request.url.split('?', 1)[1])),
+            meta=meta,
+            dont_filter=True)
+
+
+class LibraryPriorityMiddleware(object):
+    # Spider middleware passing each LibrarySpider request's priority on to
+    # the requests that follow from it, raised by LIBRARY_HOP_PRIORITY, so
+    # a lookup already under way is finished before new searches start,
+    # and lookups otherwise go in wishlist order.
+
+    def __init__(self, hop_priority):
+        self.hop_priority = hop_priority
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.getint('LIBRARY_HOP_PRIORITY'))
+
+    def process_spider_output(self, response, result, spider):
+        for output in result:
+            if (isinstance(output, Request) and
+                    'library_lookups' in output.meta):
+                output.priority = response.request.priority + self.hop_priority
+            yield output
+
+
+class LibraryStateMiddleware(object):
+    # Spider middleware that follows each LibraryLookup through its chain
+    # of catalog requests and, once the last one has been parsed without
+    # errors, records the collected holdings in the spider's LibraryState.
+    # Lookups with a failed or dropped request are left stale so the next
+    # run searches them again. A request coalesced by RequestCoalescer
+    # counts once for every lookup subscribed to it.
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_spider_input(self, response, spider):
+        for lookup in response.meta.get('library_lookups', ()):
+            lookup.pending -= 1
+
+    def process_spider_output(self, response, result, spider):
+        lookups = set(response.meta.get('library_lookups', ()))
+
+        for output in result:
+            if isinstance(output, Request):
+                for lookup in output.meta.get('library_lookups', ()):
+                    if lookup in lookups:
+                        lookup.pending += 1
+            elif lookups:
+                holding = item_values(output)
+                holding.pop('isbn', None)
+                for lookup in lookups:
+                    lookup.holdings.append(holding)
+            yield output
+
+        for lookup in lookups:
+            if lookup.pending or lookup.failed:
+                continue
+
+            changed = spider.library_state.update(
+                lookup.isbn, lookup.library, lookup.holdings)
+            self.stats.inc_value(
+                'library_state/changed' if changed
+                else 'library_state/unchanged',
+                spider=spider)
+
+    def process_spider_exception(self, response, exception, spider):
+        for lookup in response.meta.get('library_lookups', ()):
+            lookup.failed = True
+
+
+class LibraryCoalescingMiddleware(object):
+    # Spider middleware running LibrarySpider's requests and output through
+    # its RequestCoalescer. It sits outside LibraryStateMiddleware, so
+    # that one sees each callback's own output, before duplicate requests
+    # are dropped and holdings are fanned out to the other subscribers.
+
+    @classmethod
+    def _coalescer(cls, spider):
+        return getattr(spider, 'coalescer', None)
+
+    def process_start_requests(self, start_requests, spider):
+        coalescer = self._coalescer(spider)
+        for request in start_requests:
+            if coalescer is not None:
+                request = coalescer.add(request, spider)
+            if request is not None:
+                yield request
+
+    def process_spider_input(self, response, spider):
+        coalescer = self._coalescer(spider)
+        if coalescer is not None:
+            coalescer.start(response)
+
+    def process_spider_output(self, response, result, spider):
+        coalescer = self._coalescer(spider)
+        if coalescer is None:
+            return result
+        return coalescer.process_output(response, result, spider)
+
+    def process_spider_exception(self, response, exception, spider):
+        coalescer = self._coalescer(spider)
+        if coalescer is not None:
+            coalescer.fail(response)
+
+
+class InstrumentationMiddleware(object):
+    # Spider middleware timing each callback for CrawlInstrumentation: the
+    # CPU time spent producing its output, and how many items and requests
+    # it yielded. It sits next to the spider, so only the callback's own
+    # work is timed.
+
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        for extension in crawler.extensions.middlewares:
+            if isinstance(extension, CrawlInstrumentation):
+                return cls(extension)
+        raise NotConfigured
+
+    def process_spider_output(self, response, result, spider):
+        callback = self.instrumentation.callbacks[
+            request_callback(response.request)]
+        callback.responses += 1
+
+        result = iter(result)
+        done = object()
+        while True:
+            start = time.process_time()
+            try:
+                output = next(result, done)
+            finally:
+                callback.parse_cpu_seconds += time.process_time() - start
+
+            if output is done:
+                return
+            if isinstance(output, Request):
+                callback.requests += 1
+            else:
+                callback.items += 1
+            yield output
@@ -0,0 +1,44 @@
+import functools
+
+import scrapy.http
+
+from .items import Holding, item_values
+
+# Spider instances for parse_offloaded(), one per spider class, created in
+# each worker process as they're first needed.
+_spiders = {}
+
+
+def offloadable(*meta_keys):
+    # Marks a spider callback that ParseOffloadMiddleware may run in a
+    # worker process instead: one that only yields Holdings and reads
+    # nothing from its response's meta but `meta_keys`. Once the worker
+    # has parsed a response, the callback yields the holdings it found
+    # rather than parsing the response again.
+    def decorator(callback):
+        @functools.wraps(callback)
+        def wrapper(self, response):
+            records = response.meta.pop('offloaded_holdings', None)
+            if records is None:
+                return callback(self, response)
+            return (Holding(**record) for record in records)
+
+        wrapper.offload_meta = meta_keys
+        return wrapper
+
+    return decorator
+
+
+def parse_offloaded(spider_class, callback_name, response_class, url, body,
+                    encoding, meta):
+    # Runs in a worker process: the holdings an offloadable callback parses
+    # from the response, as plain dicts.
+    spider = _spiders.get(spider_class)
+    if spider is None:
+        spider = _spiders[spider_class] = spider_class()
+
+    callback = getattr(spider_class, callback_name).__wrapped__
+    response = response_class(
+        url, body=body, encoding=encoding,
+        request=scrapy.http.Request(url, meta=meta))
+    return [item_values(holding) for holding in callback(spider, response)]
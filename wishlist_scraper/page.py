@@ -0,0 +1,271 @@
+PREFERRED_BRANCHES = {
+    'MBLN': frozenset(['BPL - Central', 'INTERNET']),
+    'Minuteman': frozenset(['CAMBRIDGE', 'INTERNET']),
+}
+
+import argparse
+import functools
+import itertools
+from collections import defaultdict
+
+from jinja2 import (
+    Environment, FileSystemBytecodeCache, FileSystemLoader, StrictUndefined)
+from scrapy.utils.project import data_path
+
+from .holdings import HoldingsIndex
+from .store import HoldingsStore
+from .utils import iter_json_lines, write_file
+
+
+def get_holdings(holdings_index, isbn, library=None, branches=None):
+    return holdings_index.get_holdings(
+        isbn, library=library, branches=branches)
+
+
+def get_best_branches(holdings_index, isbn, library):
+    return holdings_index.best_branches(isbn, library)
+
+
+def sort_key(value):
+    return [int(i) for i in value['sort_key'].split('/')]
+
+
+def group_by_wishlist(wishlist_items):
+    # Wishlist ID -> its items, in the order the wishlists first appear.
+    # Items scraped before wishlists were tracked are grouped under None.
+    wishlists = {}
+    for item in wishlist_items:
+        wishlists.setdefault(item.get('wishlist'), []).append(item)
+    return wishlists
+
+
+def page_file(output, wishlist):
+    # `output` with any %(wishlist)s replaced by the wishlist's ID.
+    return output % {'wishlist': wishlist}
+
+
+def read_holdings(path):
+    # Exported Holdings have every field, if only as null; the rest of the
+    # page expects a loaded LibraryAvailability's missing keys instead.
+    with open(path) as holdings_fp:
+        for holding in iter_json_lines(holdings_fp):
+            yield {
+                key: value
+                for key, value
+                in holding.items()
+                if value is not None
+            }
+
+
+def summarize_holdings(holdings, display_branches):
+    # Everything the templates show about an item's holdings, totalled in
+    # one pass: per library, and per display branch and call number within
+    # each library.
+    libraries = {}
+    for holding in holdings:
+        available = int(holding.get('available', False))
+
+        library = libraries.get(holding['library'])
+        if library is None:
+            library = libraries[holding['library']] = {
+                'name': holding['library'],
+                'available': 0,
+                'copies': 0,
+                'branches': {},
+            }
+        library['available'] += available
+        library['copies'] += holding['copies']
+
+        if holding['branch'] not in display_branches:
+            continue
+
+        branch = library['branches'].get(holding['branch'])
+        if branch is None:
+            branch = library['branches'][holding['branch']] = {
+                'name': holding['branch'],
+                'available': 0,
+                'copies': 0,
+                'holds': 0,
+                'digital_url': holding.get('digital_url', ''),
+                'catalog_url': holding.get('catalog_url', ''),
+                'call_nums': {},
+            }
+        branch['available'] += available
+        branch['copies'] += holding['copies']
+        branch['holds'] += holding['holds']
+
+        call_num = branch['call_nums'].get(holding.get('call_num', ''))
+        if call_num is None:
+            call_num = branch['call_nums'][holding.get('call_num', '')] = {
+                'call_num': holding.get('call_num', ''),
+                'available': 0,
+                'catalog_url': holding.get('catalog_url', ''),
+            }
+        call_num['available'] += available
+
+    summaries = []
+    for name in sorted(libraries):
+        library = libraries[name]
+        branches = library['branches']
+        library['branches'] = []
+        for branch_name in display_branches:
+            branch = branches.get(branch_name)
+            if branch is None or branch['copies'] <= 0:
+                continue
+            branch['call_nums'] = [
+                branch['call_nums'][call_num]
+                for call_num
+                in sorted(branch['call_nums'])
+            ]
+            library['branches'].append(branch)
+        summaries.append(library)
+    return summaries
+
+
+def prepare_item(item, holdings_index):
+    item['holdings'] = get_holdings(holdings_index, item['isbn'])
+    if item['holdings']:
+        item['display_branches'] = set(
+            itertools.chain(*[
+                get_best_branches(holdings_index, item['isbn'], library)
+                for library
+                in PREFERRED_BRANCHES
+            ])
+        )
+    item['libraries'] = summarize_holdings(
+        item['holdings'], item.get('display_branches', ()))
+    return item
+
+
+def build_template_data(wishlist_items, holdings_index):
+    template_data = {
+        'items': [],
+    }
+
+    for item in sorted(wishlist_items, key=lambda item: sort_key(item)):
+        template_data['items'].append(prepare_item(item, holdings_index))
+
+    return template_data
+
+
+@functools.lru_cache()
+def get_environment(searchpath='templates'):
+    # One environment per process, so templates are compiled once; their
+    # bytecode is also kept between runs.
+    return Environment(
+        loader=FileSystemLoader(searchpath=searchpath),
+        undefined=StrictUndefined,
+        bytecode_cache=FileSystemBytecodeCache(
+            data_path('templates', createdir=True)))
+
+
+def is_shown(item):
+    # Items Amazon has no image for are left off the page.
+    return 'url' in item['image']
+
+
+def render_item(item, searchpath='templates'):
+    template = get_environment(searchpath).get_template('item.html')
+    return template.render(item=item)
+
+
+def render(template_data, searchpath='templates'):
+    items = [item for item in template_data['items'] if is_shown(item)]
+    for item in items:
+        item['html'] = render_item(item, searchpath)
+
+    template = get_environment(searchpath).get_template('main.html')
+    return template.render(template_data, items=items)
+
+
+class LivePage(object):
+    # Each wishlist's page, kept up to date as wishlist items and holdings
+    # are scraped, for the page command's server. Each item's HTML is kept
+    # and only rendered again once the item or its holdings change, so a
+    # request mid-crawl costs little more than joining the items' HTML. A
+    # holding updates every wishlist with an item of its ISBN.
+
+    def __init__(self, holdings_index, searchpath='templates'):
+        self.holdings_index = holdings_index
+        self.searchpath = searchpath
+        # wishlist -> sort_key -> item
+        self.items = defaultdict(dict)
+        # isbn -> (wishlist, sort_key) of the items with that ISBN.
+        self.isbn_items = defaultdict(set)
+        # wishlist -> sort_keys of the items to render again.
+        self.changed = defaultdict(set)
+
+    def add_item(self, item):
+        if not is_shown(item):
+            return
+        wishlist = item.get('wishlist')
+        self.items[wishlist][item['sort_key']] = item
+        self.isbn_items[item['isbn']].add((wishlist, item['sort_key']))
+        self.changed[wishlist].add(item['sort_key'])
+
+    def add_holding(self, holding):
+        self.holdings_index.add(holding)
+        for wishlist, key in self.isbn_items.get(holding['isbn'], ()):
+            self.changed[wishlist].add(key)
+
+    def render(self, wishlist=None):
+        items = self.items.get(wishlist, {})
+        for key in self.changed.pop(wishlist, ()):
+            item = prepare_item(items[key], self.holdings_index)
+            item['html'] = render_item(item, self.searchpath)
+
+        template = get_environment(self.searchpath).get_template('main.html')
+        return template.render(items=sorted(items.values(), key=sort_key))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-o', '--output', metavar='FILE',
+        help='write the page to FILE instead; with several wishlists, '
+             'each one\'s page is written to FILE with %%(wishlist)s '
+             'replaced by its ID')
+    arg_parser.add_argument(
+        '--store', metavar='FILE',
+        help='read the last finished crawls from the HoldingsStore in FILE '
+             'instead of wishlist.jl and library.jl')
+    args = arg_parser.parse_args()
+
+    if args.store:
+        store = HoldingsStore(args.store)
+        wishlist_runs = store.last_runs('wishlist')
+        if not wishlist_runs:
+            arg_parser.error(
+                'no finished wishlist crawl in {}'.format(args.store))
+        wishlists = group_by_wishlist(store.wishlist_items(wishlist_runs[0]))
+    else:
+        with open('wishlist.jl') as wishlist_fp:
+            wishlists = group_by_wishlist(iter_json_lines(wishlist_fp))
+    if len(wishlists) > 1 and '%(wishlist)s' not in (args.output or ''):
+        arg_parser.error(
+            'several wishlists were scraped; -o FILE must include '
+            '%(wishlist)s')
+
+    # Holdings are shared by every wishlist with an item of their ISBN.
+    if args.store:
+        # Only the holdings of the ISBNs on the wishlists are read.
+        library_runs = store.last_runs('library')
+        holdings = store.holdings(
+            library_runs[0],
+            sorted(set(
+                item['isbn']
+                for wishlist_items
+                in wishlists.values()
+                for item
+                in wishlist_items
+            ))) if library_runs else ()
+    else:
+        holdings = read_holdings('library.jl')
+    holdings_index = HoldingsIndex(PREFERRED_BRANCHES, holdings=holdings)
+
+    for wishlist, wishlist_items in wishlists.items():
+        page = render(build_template_data(wishlist_items, holdings_index))
+        if args.output:
+            write_file(page_file(args.output, wishlist), page)
+        else:
+            print(page)
@@ -1,11 +1,74 @@
-from .items import LibraryAvailability
+import logging
+import sqlite3
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from .items import Holding, LibraryAvailability, WishlistItem
+from .store import HoldingsStore
+
+
+logger = logging.getLogger(__name__)
+
 
 class LibraryAvailabilityPipeline(object):
     def process_item(self, item, spider):
+        if isinstance(item, Holding):
+            # Already typed, with the defaults below, when constructed.
+            return item
+
         if type(item) != LibraryAvailability:
             return item
 
         item.setdefault('available', False)
         item.setdefault('copies', '1')
         item.setdefault('holds', '0')
+
+        # Exports apply the fields' int serializers, but in-process
+        # consumers such as the page command see the items as scraped.
+        item['copies'] = int(item['copies'])
+        item['holds'] = int(item['holds'])
+        return item
+
+
+class HoldingsStorePipeline(object):
+    # Records each crawl's wishlist items and holdings as a run in the
+    # HoldingsStore, alongside the feed export. A run only counts as
+    # finished, and so is only read back, once its spider closes. Items
+    # the store can't take yet still go on to the feed and the page.
+
+    def __init__(self, settings):
+        if not settings.get('HOLDINGS_STORE_FILE'):
+            raise NotConfigured
+        self.settings = settings
+        self.store = None
+        self.run = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(crawler.settings)
+        crawler.signals.connect(
+            pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.store = HoldingsStore.from_settings(self.settings)
+        self.run = self.store.start_run(spider.name)
+
+    def spider_closed(self, spider, reason):
+        if reason == 'finished':
+            self.store.finish_run(self.run)
+        self.store.close()
+
+    def process_item(self, item, spider):
+        try:
+            if isinstance(item, WishlistItem):
+                self.store.add_wishlist_item(self.run, item)
+            elif isinstance(item, (Holding, LibraryAvailability)):
+                self.store.add_holding(self.run, item)
+        except sqlite3.OperationalError:
+            logger.exception(
+                'Writing to the holdings store failed; the queued rows '
+                'will be written with the next ones',
+                extra={'spider': spider})
         return item
@@ -0,0 +1,108 @@
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+import scrapy.http
+import scrapy.selector
+
+
+_css_translator = HTMLTranslator()
+
+
+class CompiledSelector(object):
+    # An XPath (or CSS selector, translated to XPath) compiled once and
+    # evaluated relative to whatever node it's applied to: a response, a
+    # Selector or a plain lxml element.
+
+    def __init__(self, xpath=None, css=None):
+        if css is not None:
+            xpath = _css_translator.css_to_xpath(css)
+        self.xpath = xpath
+        self._compiled = etree.XPath(xpath, smart_strings=False)
+
+    def __repr__(self):
+        return '<CompiledSelector {!r}>'.format(self.xpath)
+
+    @classmethod
+    def _root(cls, node):
+        if isinstance(node, scrapy.http.TextResponse):
+            node = node.selector
+        return getattr(node, 'root', node)
+
+    def __call__(self, node):
+        return scrapy.selector.SelectorList([
+            scrapy.selector.Selector(root=result, type='html')
+            for result
+            in self._compiled(self._root(node))
+        ])
+
+    def extract(self, node):
+        return [
+            result
+            if isinstance(result, str)
+            else etree.tostring(
+                result, method='html', encoding='unicode', with_tail=False)
+            for result
+            in self._compiled(self._root(node))
+        ]
+
+    def extract_first(self, node, default=None):
+        results = self.extract(node)
+        return results[0] if results else default
+
+
+def css(expression):
+    return CompiledSelector(css=expression)
+
+
+def xpath(expression):
+    return CompiledSelector(xpath=expression)
+
+
+class SelectorRegistry(object):
+    def __init__(self, **selectors):
+        self.__dict__.update(selectors)
+
+
+BRL = SelectorRegistry(
+    results=css('.list_item_outer'),
+    format=css('.format'),
+    jacket_url=css('.jacketCoverLink::attr(href)'),
+    item_url=xpath('.//*[contains(@href, "item/show")]/@href'),
+    circulation_url=xpath('.//*[contains(@href, "show_circulation")]/@href'),
+    ebook_available=css('.availability_block .digital::text'),
+    ebook_holds=css('.availability_block .holdposition::text'),
+    branches=css('.branch'),
+    branch_rows=css('tbody tr'),
+    notes=css('.notes'),
+    row_branch=xpath('td[1]/text()'),
+    row_collection=xpath('td[2]/text()'),
+    row_call_num=xpath('td[3]/text()'),
+    row_available=xpath('td[4]/text()'),
+)
+
+HLS = SelectorRegistry(
+    link_url=css('a::attr(href)'),
+    availability_url=xpath('//a[text() = "Availability"]/@href'),
+    result_rows=xpath('//a[text() = "Author"]/../../following-sibling::tr'),
+    holdings_rows=xpath(
+        '//th[text() = "Collection"]/../following-sibling::tr'),
+    row_branch=xpath('td[1]/text()'),
+    row_collection=xpath('td[2]/text()'),
+    row_call_num=xpath('td[3]/text()'),
+)
+
+MLN = SelectorRegistry(
+    results=css('.briefcitRow'),
+    title=css('.briefcitTitle'),
+    link_url=css('a::attr(href)'),
+    media_type=css('.briefcitMatType'),
+    full_availability_url=xpath(
+        '//form[contains(@action, "holdings")]/@action'),
+    locations=css('.bibItemsEntry'),
+    location=css('td:nth-child(1)'),
+    location_text=css('td:nth-child(1) a::text'),
+    status_text=css('td:nth-child(3)::text'),
+    call_num=css('td:nth-child(2) a::text'),
+    bib_links=css('.bibLinks'),
+    digital_media_url=xpath(
+        '//a[contains(text(), "Digital Media Catalog")]/@href'),
+)
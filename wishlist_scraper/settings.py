@@ -1,14 +1,103 @@
 BOT_NAME = 'amazon_wishlist'
 
 SPIDER_MODULES = ['wishlist_scraper.spiders']
-CONCURRENT_REQUESTS = 1
+COMMANDS_MODULE = 'wishlist_scraper.commands'
+CONCURRENT_REQUESTS = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 1
 HTTPCACHE_ENABLED = True
 HTTPCACHE_EXPIRATION_SECS = 18 * 60 * 60
+HTTPCACHE_STORAGE = 'wishlist_scraper.httpcache.SqliteCacheStorage'
+HTTPCACHE_DOMAIN_EXPIRATION_SECS = {
+    'www.amazon.com': 6 * 60 * 60,
+    'bpl.bibliocommons.com': 12 * 60 * 60,
+    'library.minlib.net': 12 * 60 * 60,
+}
+HTTPCACHE_COMPRESSION_LEVEL = 6
+HTTPCACHE_COMMIT_INTERVAL = 100
 ITEM_PIPELINES = {
     'wishlist_scraper.pipelines.LibraryAvailabilityPipeline': 100,
+    'wishlist_scraper.pipelines.HoldingsStorePipeline': 200,
+}
+DOWNLOADER_MIDDLEWARES = {
+    'wishlist_scraper.middlewares.ParseOffloadMiddleware': 100,
+    'wishlist_scraper.middlewares.HollisSessionMiddleware': 850,
+    'wishlist_scraper.middlewares.AmazonProductApiMiddleware': 950,
+    'wishlist_scraper.middlewares.CatalogConcurrencyMiddleware': 960,
 }
 SPIDER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.cookies.CookiesMiddleware': 100,
+    'wishlist_scraper.middlewares.LibraryCoalescingMiddleware': 940,
+    'wishlist_scraper.middlewares.LibraryStateMiddleware': 950,
+    'wishlist_scraper.middlewares.LibraryPriorityMiddleware': 960,
+    'wishlist_scraper.middlewares.InstrumentationMiddleware': 990,
+}
+EXTENSIONS = {
+    'wishlist_scraper.extensions.CrawlInstrumentation': 500,
 }
 COOKIES_ENABLED = True
 USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.12; rv:49.0) Gecko/20100101 Firefox/49.0'
+
+AMAZON_API_THREADS = 2
+AMAZON_API_MAX_RETRIES = 5
+AMAZON_API_RETRY_BACKOFF = 1
+AMAZON_API_RETRY_MAX_BACKOFF = 30
+
+AMAZON_API_CACHE_FILE = 'amazon-api-cache.db'
+AMAZON_API_CACHE_TTL = {
+    'Medium': 24 * 60 * 60,
+    'Reviews': 7 * 24 * 60 * 60,
+}
+AMAZON_API_CACHE_DEFAULT_TTL = 24 * 60 * 60
+AMAZON_API_CACHE_NEGATIVE_TTL = 7 * 24 * 60 * 60
+AMAZON_API_CACHE_MAX_BYTES = 64 * 1024 * 1024
+AMAZON_API_CACHE_COMPACT_INTERVAL = 1000
+
+# Upper bounds for each LibrarySpider backend's adaptive concurrency; every
+# backend starts at CONCURRENT_REQUESTS_PER_DOMAIN.
+CATALOG_CONCURRENCY_MAX = {
+    'BRL': 4,
+    'MLN': 4,
+    'HLS': 2,
+}
+CATALOG_CONCURRENCY_TARGET_LATENCY = 3.0
+CATALOG_CONCURRENCY_MAX_DELAY = 30
+
+# LibrarySpider searches are prioritized by wishlist position (the first
+# item's highest), and each follow-up request by its parent's priority
+# plus LIBRARY_HOP_PRIORITY.
+LIBRARY_HOP_PRIORITY = 1000
+
+# Parsed catalog responses whose holdings and follow-up requests
+# LibrarySpider keeps to answer repeats of their requests with; see
+# RequestCoalescer.
+LIBRARY_COALESCE_MAX_RECORDS = 5000
+
+# Hollis sessions shared by LibrarySpider's HLS searches; one per request
+# the HLS download slot may have in flight. 0 disables session reuse.
+HOLLIS_SESSIONS = 2
+HOLLIS_HANDSHAKE_TIMEOUT = 60
+
+# Worker processes parsing LibrarySpider's holdings pages off the reactor
+# thread; see ParseOffloadMiddleware. 0 parses them in the crawl process.
+PARSE_OFFLOAD_PROCESSES = 0
+
+LIBRARY_STATE_FILE = 'library-state.db'
+# Holdings are searched again once they are older than LIBRARY_STATE_MAX_AGE,
+# or LIBRARY_STATE_STABLE_MAX_AGE if they haven't changed for
+# LIBRARY_STATE_STABLE_AFTER.
+LIBRARY_STATE_MAX_AGE = 20 * 60 * 60
+LIBRARY_STATE_STABLE_AFTER = 7 * 24 * 60 * 60
+LIBRARY_STATE_STABLE_MAX_AGE = 3 * 24 * 60 * 60
+
+# Every crawl's wishlist items and holdings, kept as a run for page.py
+# --store and `scrapy changes`. An empty string disables it.
+HOLDINGS_STORE_FILE = 'holdings.sqlite'
+HOLDINGS_STORE_COMMIT_INTERVAL = 100
+# Seconds a write waits for another connection's lock before it fails.
+HOLDINGS_STORE_TIMEOUT = 5
+
+INSTRUMENTATION_ENABLED = True
+# Written when each spider closes; %(name)s is the spider's name. Set either
+# to an empty string to skip it.
+INSTRUMENTATION_JSON_FILE = 'crawl-report-%(name)s.json'
+INSTRUMENTATION_PROMETHEUS_FILE = 'crawl-report-%(name)s.prom'
@@ -0,0 +1,7 @@
+# One module per backend: Amazon wishlists in wishlist.py and the library
+# catalogs in library.py. Scrapy imports all of them for any crawl, so
+# dependencies only one spider needs, such as bottlenose and gdbm, are
+# imported where that spider first uses them.
+
+from .library import LibrarySpider
+from .wishlist import AMAZON_API_URL, WishlistSpider
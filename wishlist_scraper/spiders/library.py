@@ -0,0 +1,564 @@
+#!/usr/bin/env python -tt
+
+import copy
+import re
+import weakref
+from urllib.parse import urlencode
+
+import lxml.html
+import scrapy.exceptions
+import scrapy.http
+import scrapy.signals
+import scrapy.spiders
+from twisted.internet import task
+
+from ..coalescing import RequestCoalescer
+from ..hollis import HollisSessions
+from ..items import Holding, parse_available, parse_call_num
+from ..jsvars import extract_js_vars
+from ..library_state import LibraryLookup, LibraryState
+from ..loaders import LibraryAvailabilityLoader
+from ..offload import offloadable
+from .. import selectors
+from ..utils import isbn_variants, iter_json_lines, qualified_url
+
+
+class LibrarySpider(scrapy.spiders.Spider):
+    name = 'library'
+
+    libraries = ['BRL', 'MLN']
+
+    _js_vars_cache = weakref.WeakKeyDictionary()
+
+    # Overridable with `scrapy crawl library -a wishlist=...`.
+    wishlist = 'wishlist.jl'
+    # Set while wishlist items are still being fed in: from self.wishlist,
+    # or by another crawler in the same process as it scrapes them; see the
+    # `page` command.
+    feed_open = False
+
+    @classmethod
+    def _unescape(cls, text):
+        return lxml.html.fromstring(text).text
+
+    @classmethod
+    def _extract_script(cls, selector):
+        return [
+            re.sub(
+                r'(<!--.*$)|(\s+-->.*$)', '',
+                script.extract(), flags=re.MULTILINE)
+            for script
+             in selector.css('script::text')
+        ]
+
+    @classmethod
+    def _extract_js_vars(cls, selector):
+        # Memoized per response, since e.g. the HLS availability parser
+        # needs the same page's variables for every row.
+        if selector in cls._js_vars_cache:
+            return cls._js_vars_cache[selector]
+
+        js_vars = {}
+        for script in cls._extract_script(selector):
+            js_vars.update(extract_js_vars(script))
+
+        cls._js_vars_cache[selector] = js_vars
+        return js_vars
+
+    @classmethod
+    def _join_text(cls, values):
+        return ' '.join(value.strip() for value in values)
+
+    @classmethod
+    def _first_text(cls, values):
+        for value in values:
+            value = value.strip()
+            if value:
+                return value
+        return None
+
+    @classmethod
+    def _item_priority(cls, item):
+        # Earlier wishlist items are searched first.
+        return -int(item.get('sort_key', '0').split('/')[0])
+
+    @classmethod
+    def _searchable_title(cls, title):
+        title = re.sub(r'[:;]\s*[^:;]+$', '', title)
+        title = re.sub(r'\s*\(.*\)$', '', title)
+        return title
+
+    @classmethod
+    def _searchable_author(cls, author):
+        author = re.sub(r'\s+Ph\.?\s*D\.?$', '', author)
+        return author
+
+    @classmethod
+    def _build_BRL_url(cls, item, library):
+        query_string = urlencode((
+            ('custom_query', u'title:({}) AND contributor:({})'.format(
+                cls._searchable_title(item['title']),
+                cls._searchable_author(item.get('by', ''))).encode('utf-8')),
+            ('searchscope', 'MBLN'),
+            ('suppress', 'true'),
+            ('custom_edit', 'false'),
+        ), True)
+
+        return 'http://bpl.bibliocommons.com/search?{}'.format(
+            query_string)
+
+    @classmethod
+    def _build_BRL_isbn_url(cls, isbns):
+        query_string = urlencode((
+            ('custom_query', 'identifier:({})'.format(' OR '.join(isbns))),
+            ('searchscope', 'MBLN'),
+            ('suppress', 'true'),
+            ('custom_edit', 'false'),
+        ))
+
+        return 'http://bpl.bibliocommons.com/search?{}'.format(
+            query_string)
+
+    @classmethod
+    def _build_HLS_url(cls, item, library):
+        query_string = urlencode((
+            ('func', 'find-c'),
+            ('CCL_TERM', u'(WTN={} AND WAN={} AND WLG=eng)'.format(
+                cls._searchable_title(item['title']),
+                cls._searchable_author(item['by'])).encode('utf-8')),
+            ('adjacent', 1),
+        ), True)
+
+        return 'http://lms01.harvard.edu/F/?{}'.format(query_string)
+
+    @classmethod
+    def _build_HLS_isbn_url(cls, isbns):
+        query_string = urlencode((
+            ('func', 'find-b'),
+            ('find_code', 'IBN'),
+            ('request', ' OR '.join(isbns)),
+        ))
+
+        return 'http://lms01.harvard.edu/F/?{}'.format(query_string)
+
+    @classmethod
+    def _build_MLN_url(cls, item, library):
+        query_string = urlencode((
+            ('SEARCH', u't:({}) and a:({})'.format(
+                cls._searchable_title(item['title']),
+                cls._searchable_author(item.get('by', ''))).encode('utf-8')),
+            ('searchscope', 1),
+        ), True)
+
+        return 'http://library.minlib.net/search/X?{}'.format(query_string)
+
+    @classmethod
+    def _build_MLN_isbn_url(cls, isbns):
+        query_string = urlencode((
+            ('SEARCH', 'i:({})'.format(' or '.join(isbns))),
+            ('searchscope', 1),
+        ))
+
+        return 'http://library.minlib.net/search/X?{}'.format(query_string)
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(LibrarySpider, cls).from_crawler(
+            crawler, *args, **kwargs)
+
+        spider.library_state = LibraryState.from_settings(crawler.settings)
+        # Items on several wishlists are only searched for once.
+        spider.isbns = set()
+        spider.coalescer = RequestCoalescer(
+            crawler.stats, spider.parse_stored_holdings,
+            crawler.settings.getint('LIBRARY_COALESCE_MAX_RECORDS'))
+        spider.hollis_sessions = None
+        if crawler.settings.getint('HOLLIS_SESSIONS'):
+            spider.hollis_sessions = HollisSessions.from_crawler(crawler)
+        crawler.signals.connect(
+            spider.library_state.close, signal=scrapy.signals.spider_closed)
+        crawler.signals.connect(
+            spider.spider_opened, signal=scrapy.signals.spider_opened)
+        crawler.signals.connect(
+            spider.spider_idle, signal=scrapy.signals.spider_idle)
+
+        return spider
+
+    def start_requests(self):
+        # Every item is scheduled with feed_item(), even those read from
+        # self.wishlist; see spider_opened().
+        return []
+
+    def spider_opened(self, spider):
+        if not self.wishlist:
+            # Another crawler feeds the items in.
+            return
+
+        # The file is read a line per cooperative step and each item fed
+        # in as it's read, so the first searches go out before the rest is
+        # parsed. Start requests are only pulled as the downloader has room
+        # for them, so their priority couldn't order them; fed requests go
+        # straight to the scheduler, which orders them by wishlist position.
+        self.feed_open = True
+        d = task.cooperate(self._read_wishlist()).whenDone()
+        d.addErrback(
+            lambda failure: self.logger.error(
+                'Reading %s failed: %s', self.wishlist,
+                failure.getErrorMessage()))
+        d.addBoth(lambda _: self.close_feed())
+
+    def _read_wishlist(self):
+        with open(self.wishlist) as items_fp:
+            for item in iter_json_lines(items_fp):
+                self.feed_item(item)
+                yield
+
+    def feed_item(self, item):
+        if item['isbn'] in self.isbns:
+            return
+        self.isbns.add(item['isbn'])
+
+        # These skip the spider middleware, so are coalesced here.
+        for library in self.libraries:
+            request = self.coalescer.add(
+                self._library_request(item, library), self)
+            if request is None:
+                continue
+            if (self.hollis_sessions is not None and
+                    self.hollis_sessions.hold(request, self)):
+                continue
+            self.crawler.engine.crawl(request, self)
+
+    def close_feed(self):
+        self.feed_open = False
+
+    def spider_idle(self):
+        if self.feed_open:
+            raise scrapy.exceptions.DontCloseSpider
+        # Searches still held for a Hollis session that isn't coming.
+        if (self.hollis_sessions is not None and
+                self.hollis_sessions.flush(self)):
+            raise scrapy.exceptions.DontCloseSpider
+
+    def _library_request(self, item, library):
+        record = self.library_state.get(item['isbn'], library)
+        if record and self.library_state.is_fresh(record):
+            self.crawler.stats.inc_value('library_state/reused', spider=self)
+            return scrapy.http.Request(
+                'data:,',
+                meta={
+                    'isbn': item['isbn'],
+                    'holdings': record['holdings'],
+                    'dont_cache': True,
+                },
+                priority=self._item_priority(item),
+                dont_filter=True,
+                callback=self.parse_stored_holdings)
+
+        # Each catalog gets its own download slot, sized by
+        # CatalogConcurrencyMiddleware. Only the ISBN is carried along; the
+        # rest of the item is needed just to build these URLs.
+        meta = {
+            'isbn': item['isbn'],
+            'download_slot': library,
+            'library_lookups': [LibraryLookup(item['isbn'], library)],
+        }
+        url = getattr(self, '_build_{}_url'.format(library))(item, library)
+
+        # Searching by ISBN usually lands on the one matching record, so
+        # the title and author search is only a fallback for when it misses.
+        isbns = isbn_variants(item.get('isbns') or item['isbn'].split())
+        if isbns:
+            meta['fallback_url'] = url
+            url = getattr(self, '_build_{}_isbn_url'.format(library))(isbns)
+
+        return scrapy.http.Request(
+            url, meta=meta, priority=self._item_priority(item),
+            callback=getattr(self, 'parse_{}_response'.format(library)))
+
+    def _fallback_requests(self, response):
+        # The title and author search after an ISBN search that missed.
+        if 'fallback_url' not in response.meta:
+            return
+
+        self.crawler.stats.inc_value('library/isbn_miss', spider=self)
+        meta = dict(response.meta)
+        url = meta.pop('fallback_url')
+        library = meta['library_lookups'][0].library
+        yield scrapy.http.Request(
+            url, meta=meta,
+            callback=getattr(self, 'parse_{}_response'.format(library)))
+
+    def parse_stored_holdings(self, response):
+        for holding in response.meta['holdings']:
+            yield Holding(isbn=response.meta['isbn'], **holding)
+
+        # A RequestCoalescer replay also repeats the parsed response's
+        # follow-up requests, now on behalf of its own lookups.
+        for request in response.meta.get('requests', ()):
+            yield request.replace(meta=dict(
+                request.meta,
+                isbn=response.meta['isbn'],
+                library_lookups=response.meta['library_lookups']))
+
+    def parse_BRL_response(self, response):
+        # http://bpl.bibliocommons.com/search?custom_query=identifier%3A(9780446573016)%20%20%20formatcode%3A(BK%20OR%20EBOOK%20)&search_scope=MBLN&suppress=true&custom_edit=false
+        if 'No direct matches were found.' in response.body.decode():
+            yield from self._fallback_requests(response)
+            return
+
+        for result in selectors.BRL.results(response):
+            meta = copy.copy(response.meta)
+            format = selectors.BRL.format.extract_first(result, '')
+
+            if 'eBook' in format:
+                meta['item_url'] = qualified_url(
+                    response, selectors.BRL.jacket_url.extract_first(result))
+
+                yield from self.parse_item_BRL_ebook_availability(
+                    result, meta)
+                continue
+            elif 'Book' in format:
+                meta['item_url'] = qualified_url(
+                    response, selectors.BRL.item_url.extract_first(result))
+                availability_url = qualified_url(
+                    response,
+                    selectors.BRL.circulation_url.extract_first(result))
+
+                yield scrapy.http.Request(
+                    availability_url, meta=meta,
+                    callback=self.parse_item_BRL_availability)
+
+    def parse_item_BRL_ebook_availability(self, result, meta):
+        # Roxbury Community College students and faculty only: Click here
+        # for electronic book
+        if 'site.ebrary.com' in result.extract():
+            return
+
+        holds = selectors.BRL.ebook_holds.extract(result)
+
+        avail_item = LibraryAvailabilityLoader()
+        avail_item.add_value('isbn', meta['isbn'])
+        avail_item.add_value('library', 'MBLN')
+        avail_item.add_value('digital_url', meta['item_url'])
+        avail_item.add_value('branch', 'INTERNET')
+        avail_item.add_value('collection', 'Overdrive')
+        avail_item.add_value('call_num', 'INTERNET')
+        avail_item.add_value(
+            'available', selectors.BRL.ebook_available.extract(result))
+        avail_item.add_value('holds', holds)
+        avail_item.add_value('copies', holds)
+        yield avail_item.load_item()
+
+    @offloadable('isbn', 'item_url')
+    def parse_item_BRL_availability(self, response):
+        # http://bpl.bibliocommons.com//item/show_circulation/1598453075?search_scope=MBLN
+        for branch in selectors.BRL.branches(response):
+            for row in selectors.BRL.branch_rows(branch):
+                if selectors.BRL.notes(row):
+                    continue
+
+                call_num = self._first_text(
+                    selectors.BRL.row_call_num.extract(row))
+                available = self._first_text(
+                    selectors.BRL.row_available.extract(row))
+                if call_num and 'On-Order' in call_num:
+                    available = None
+
+                yield Holding(
+                    isbn=response.meta['isbn'],
+                    library='MBLN',
+                    catalog_url=response.meta['item_url'],
+                    branch=self._join_text(
+                        selectors.BRL.row_branch.extract(row)),
+                    collection=self._join_text(
+                        selectors.BRL.row_collection.extract(row)),
+                    call_num=call_num and parse_call_num(call_num),
+                    available=available and parse_available(available))
+
+    def parse_HLS_response(self, response):
+        # http://hollisclassic.harvard.edu/F/?func=find-b&find_code=IBN&request=9780312272050
+        js_vars = self._extract_js_vars(response)
+        if 'callback_url' not in js_vars:
+            # Searched within a session (see HollisSessionMiddleware), so
+            # there's no handshake and these are the results already.
+            yield from self.parse_item_HLS_item_list(response)
+            return
+
+        redirect_url = self._unescape(
+            '{}{}'.format(js_vars['url'], js_vars['callback_url']))
+        yield scrapy.http.Request(
+            redirect_url, meta=response.meta,
+            callback=self.parse_item_HLS_sso_redirect)
+
+    def parse_item_HLS_sso_redirect(self, response):
+        # <A HREF=http://lms01.harvard.edu:80/F/3JXTKP544E6B88MX7KBBLG2BKGTJNN4TVD8M8Y5BRL65FQE5R4-00988?func=item-global&doc_library=HVD01&doc_number=009100826&year=&volume=&sub_library=>Availability</A>
+        url = selectors.HLS.link_url.extract_first(response)
+        redirect_url = qualified_url(response, self._unescape(url))
+        yield scrapy.http.Request(
+            redirect_url, meta=response.meta,
+            callback=self.parse_item_HLS_item_list)
+
+    def parse_item_HLS_item_list(self, response):
+        # http://lms01.harvard.edu/F/4MPLXBRST48H83712RTD3UHGFJNUMN52X5978M9KLH3P3XQLEI-39748?func=find-c&CCL_TERM=%28WTN%3DBecoming+a+Manager+AND+WAN%3DLinda+A.+Hill%29&adjacent=1&pds_handle=GUEST
+        if selectors.HLS.availability_url(response):
+            # A single match goes straight to the item's page.
+            yield from self.parse_item_HLS_item(response)
+            return
+
+        if not selectors.HLS.result_rows(response):
+            yield from self._fallback_requests(response)
+            return
+
+        # Parse the recordLink variable's HTML <A> tag for the item's URL.
+        js_vars = self._extract_js_vars(response)
+        item_url = selectors.HLS.link_url.extract_first(
+            lxml.html.fromstring(js_vars['recordLink']))
+        item_url = qualified_url(response, self._unescape(item_url))
+
+        yield scrapy.http.Request(
+            item_url, meta=response.meta, callback=self.parse_item_HLS_item)
+
+    def parse_item_HLS_item(self, response):
+        availability_url = selectors.HLS.availability_url.extract_first(
+            response)
+        if not availability_url:
+            # Hollis doesn't know about this item.
+            return
+
+        yield scrapy.http.Request(
+            availability_url, meta=response.meta,
+            callback=self.parse_item_HLS_item_availability)
+
+    @offloadable('isbn')
+    def parse_item_HLS_item_availability(self, response):
+        # http://lms01.harvard.edu:80/F/E3TTJIQAAJCMJL6RLU4BH9J4MIY3TEJ1JPLGA3MFA1HYVGJT36-11386?func=item-global&doc_library=HVD01&doc_number=013957901&year=&volume=&sub_library=
+        js_vars = self._extract_js_vars(response)
+        if 'checkout' not in js_vars:
+            # http://lms01.harvard.edu/F/EICPLBCNJS2JIC3FYBSJF5KSN3RULBQX6S4SUBE67DPKR5T29D-20229?func=item-global&doc_library=HVD01&doc_number=014083018&year=&volume=&sub_library=%27
+            # FIXME: online resource?
+            return
+
+        available = parse_available(js_vars['checkout'].strip())
+
+        for row in selectors.HLS.holdings_rows(response):
+            collection = self._join_text(
+                selectors.HLS.row_collection.extract(row))
+            if 'depository' in collection.lower():
+                call_num = 'Depository'
+            else:
+                call_num = self._first_text(
+                    selectors.HLS.row_call_num.extract(row))
+
+            yield Holding(
+                isbn=response.meta['isbn'],
+                library='Harvard',
+                catalog_url=response.url,
+                branch=self._join_text(selectors.HLS.row_branch.extract(row)),
+                collection=collection,
+                call_num=call_num and parse_call_num(call_num),
+                available=available)
+
+    def parse_MLN_response(self, response):
+        if '1 result found' in response.body.decode():
+            yield from self.parse_item_MLN(response)
+            return
+
+        results = selectors.MLN.results(response)
+        if not results:
+            yield from self._fallback_requests(response)
+            return
+
+        for result in results:
+            title_region = selectors.MLN.title(result)[0]
+
+            if 'sound recording' in title_region.extract():
+                continue
+
+            media_type = selectors.MLN.media_type.extract_first(result, '')
+            if 'AUDIOBOOK' in media_type:
+                continue
+            if 'SPOKEN CD' in media_type:
+                continue
+
+            yield scrapy.http.Request(
+                qualified_url(
+                    response,
+                    selectors.MLN.link_url.extract_first(title_region)),
+                meta=response.meta,
+                callback=self.parse_item_MLN)
+
+    def parse_item_MLN(self, response):
+        full_availability_url = selectors.MLN.full_availability_url \
+            .extract_first(response)
+        # If a full availability form exists, use that since the
+        # list on the item's page will be truncated.
+        if full_availability_url:
+            yield scrapy.http.Request(
+                qualified_url(response, full_availability_url),
+                meta=response.meta,
+                callback=self.parse_item_MLN_item_full_availability)
+            return
+
+        for item in self.parse_item_MLN_item_full_availability(response):
+            yield item
+
+    @offloadable('isbn')
+    def parse_item_MLN_item_full_availability(self, response):
+        locations = selectors.MLN.locations(response)
+        # Some electronic content is not available to all libraries.
+        # Links to http://www.mln.lib.ma.us/scripts/db_authorization.plx
+        restricted = bool(locations) and (
+            'Commonwealth eBook Collections' in locations[0].extract())
+
+        for location in locations:
+            if 'INTERNET' in selectors.MLN.location.extract_first(
+                    location, ''):
+                branch = 'INTERNET'
+                collection = ''
+            else:
+                location_text = ' '.join(
+                    selectors.MLN.location_text.extract(location))
+                if '/' in location_text:
+                    location_components = location_text.split('/')
+                    branch = self._join_text(location_components[:-1])
+                    collection = location_components[-1].strip()
+                else:
+                    branch = location_text.strip()
+                    collection = ''
+
+            available = ' '.join(
+                selectors.MLN.status_text.extract(location)).strip()
+
+            holding = Holding(
+                isbn=response.meta['isbn'],
+                library='Minuteman',
+                catalog_url=response.url,
+                branch=branch,
+                collection=collection,
+                available=available and parse_available(available))
+
+            if 'E-RESOURCE' in available:
+                holding.call_num = 'E-RESOURCE'
+
+                if restricted:
+                    continue
+
+                bib_links = selectors.MLN.bib_links(response)
+                if bib_links:
+                    url = selectors.MLN.link_url.extract(bib_links[0])
+                else:
+                    url = selectors.MLN.digital_media_url.extract(response)
+
+                if not url:
+                    continue
+
+                holding.digital_url = qualified_url(
+                    response, url[0].strip())
+            else:
+                call_num = self._first_text(
+                    selectors.MLN.call_num.extract(location))
+                if call_num:
+                    holding.call_num = parse_call_num(call_num)
+
+            yield holding
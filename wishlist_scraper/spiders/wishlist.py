@@ -0,0 +1,313 @@
+#!/usr/bin/env python -tt
+
+import collections
+import json
+import os
+from urllib.parse import urlencode, urljoin
+
+import scrapy.http
+import scrapy.selector
+import scrapy.signals
+import scrapy.spiders
+
+from ..amazon_api_cache import AmazonApiCache
+from ..loaders import (
+    WishlistItemLoader, WishlistItemImageLoader,
+    WishlistItemAmazonPricesLoader, WishlistItemRatingOverviewLoader)
+
+AMAZON_API_URL = 'https://webservices.amazon.com/onca/xml'
+AMAZON_API_NAMESPACE = (
+    'http://webservices.amazon.com/AWSECommerceService/2013-08-01')
+# ItemLookup accepts at most 10 ItemIds per call.
+AMAZON_API_BATCH_SIZE = 10
+AMAZON_API_RESPONSE_GROUPS = ['Medium', 'Reviews']
+
+
+class WishlistSpider(scrapy.spiders.Spider):
+    name = 'wishlist'
+    wishlist_url = 'https://www.amazon.com/registry/wishlist/{}'
+
+    # Overridable with `scrapy crawl wishlist -a wishlists=ID,ID,...`;
+    # otherwise the comma-separated IDs in WISHLIST_ID. Items carry the ID
+    # of the wishlist they're on, and each ASIN on several wishlists is
+    # only looked up once.
+    wishlists = None
+
+    def __init__(self, *args, **kwargs):
+        super(WishlistSpider, self).__init__(*args, **kwargs)
+
+        if self.wishlists is None:
+            self.wishlists = os.environ['WISHLIST_ID']
+        if isinstance(self.wishlists, str):
+            self.wishlists = [
+                wishlist.strip()
+                for wishlist
+                in self.wishlists.split(',')
+                if wishlist.strip()
+            ]
+
+        self.item_nums = collections.Counter()
+        # ASIN -> the `wishlist_items` of the API request in flight for it,
+        # which other wishlists' entries for the ASIN are added to.
+        self.amazon_lookups = {}
+
+        # Imported here, as Scrapy imports every spider's module whichever
+        # one is crawled.
+        import bottlenose
+        self.amazon = bottlenose.Amazon(
+            os.environ['AWS_ACCESS_KEY_ID'],
+            os.environ['AWS_SECRET_ACCESS_KEY'],
+            os.environ['AMAZON_AFFILIATE_ID'])
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(WishlistSpider, cls).from_crawler(
+            crawler, *args, **kwargs)
+
+        spider.amazon_api_cache = AmazonApiCache.from_settings(
+            crawler.settings)
+        crawler.signals.connect(
+            spider.amazon_api_cache.close, signal=scrapy.signals.spider_closed)
+
+        return spider
+
+    def _nextPageUrl(self, response):
+        for state_node in response.css('script[type="a-state"]'):
+            state = json.loads(state_node.root.text)
+            if 'showMoreUrl' not in state:
+                continue
+            if not state.get('lastEvaluatedKey'):
+                continue
+
+            return urljoin('https://www.amazon.com', state['showMoreUrl'])
+
+    def start_requests(self):
+        for wishlist in self.wishlists:
+            yield scrapy.http.Request(
+                self.wishlist_url.format(wishlist),
+                meta={'wishlist': wishlist},
+                dont_filter=True)
+
+    def parse(self, response):
+        self.item_nums[response.meta['wishlist']] = 0
+        yield from self.parse_wishlist_page(response)
+
+    def parse_wishlist_page(self, response):
+        wishlist = response.meta['wishlist']
+
+        page_url = self._nextPageUrl(response)
+        if page_url:
+            yield scrapy.http.Request(
+                page_url, meta={'wishlist': wishlist},
+                callback=self.parse_wishlist_page)
+
+        wishlist_items = []
+        for item in response.css('div::attr(data-item-prime-info)'):
+            info = json.loads(item.extract())
+
+            self.item_nums[wishlist] += 1
+            wishlist_items.append(
+                (info['asin'], wishlist, str(self.item_nums[wishlist])))
+
+        # Items whose ASIN is already being looked up for another wishlist
+        # wait for that lookup. Nothing is yielded until the lookups this
+        # page needs are in flight, as other wishlists' pages may be parsed
+        # in between.
+        joined = 0
+        lookup_items = []
+        for entry in wishlist_items:
+            if entry[0] in self.amazon_lookups:
+                self.amazon_lookups[entry[0]].append(entry)
+                joined += 1
+            else:
+                lookup_items.append(entry)
+
+        products, invalid = self.amazon_api_cache.get_products(
+            [asin for asin, _, _ in lookup_items], AMAZON_API_RESPONSE_GROUPS)
+
+        cached_items = []
+        uncached_items = []
+        for asin, wishlist, sort_key in lookup_items:
+            if asin in invalid:
+                continue
+            if asin in products:
+                cached_items.append((products[asin], wishlist, sort_key))
+            else:
+                uncached_items.append((asin, wishlist, sort_key))
+
+        lookup_requests = [
+            self._amazon_item_lookup_request(
+                uncached_items[offset:offset + AMAZON_API_BATCH_SIZE])
+            for offset
+            in range(0, len(uncached_items), AMAZON_API_BATCH_SIZE)
+        ]
+
+        self.crawler.stats.inc_value(
+            'amazon_api_cache/hit', len(lookup_items) - len(uncached_items),
+            spider=self)
+        self.crawler.stats.inc_value(
+            'amazon_api_cache/miss', len(uncached_items), spider=self)
+        self.crawler.stats.inc_value(
+            'amazon_api_cache/joined', joined, spider=self)
+
+        for product, wishlist, sort_key in cached_items:
+            item = self._load_wishlist_item(
+                self._amazon_product_selector(product), wishlist, sort_key)
+            if item:
+                yield item
+
+        yield from lookup_requests
+
+    @classmethod
+    def _amazon_product_selector(cls, product_info):
+        sel = scrapy.selector.Selector(
+            text=product_info.decode('utf-8'), type='xml')
+        sel.register_namespace('aws', AMAZON_API_NAMESPACE)
+        return sel.xpath('/aws:Item')[0]
+
+    def _amazon_item_lookup_request(self, wishlist_items):
+        # Resolved off the reactor thread by AmazonProductApiMiddleware;
+        # the URL only identifies the request in logs and stats.
+        operation = {
+            'Operation': 'ItemLookup',
+            'ItemId': ','.join(asin for asin, _, _ in wishlist_items),
+            'ResponseGroup': ','.join(AMAZON_API_RESPONSE_GROUPS),
+        }
+        wishlist_items = list(wishlist_items)
+        for asin, _, _ in wishlist_items:
+            self.amazon_lookups[asin] = wishlist_items
+        return scrapy.http.Request(
+            '{}?{}'.format(
+                AMAZON_API_URL, urlencode(sorted(operation.items()))),
+            meta={
+                'amazon_api': operation,
+                'wishlist_items': wishlist_items,
+                'dont_cache': True,
+            },
+            callback=self.parse_amazon_items,
+            errback=self.amazon_items_failed)
+
+    def parse_amazon_items(self, response):
+        sel = scrapy.selector.Selector(response=response, type='xml')
+        sel.register_namespace('aws', AMAZON_API_NAMESPACE)
+
+        products = {
+            product.xpath('aws:ASIN/text()').extract_first(): product
+            for product
+            in sel.xpath('//aws:Items/aws:Item')
+        }
+        self.amazon_api_cache.set_products(
+            {
+                asin: product.extract().encode('utf-8')
+                for asin, product
+                in products.items()
+            },
+            AMAZON_API_RESPONSE_GROUPS)
+
+        errors = ' '.join(sel.xpath(
+            '//aws:Errors/aws:Error[aws:Code="AWS.InvalidParameterValue"]'
+            '/aws:Message/text()').extract())
+        self.amazon_api_cache.set_invalid([
+            asin
+            for asin, _, _
+            in response.meta['wishlist_items']
+            if asin not in products and asin in errors
+        ])
+
+        for asin, wishlist, sort_key in response.meta['wishlist_items']:
+            self.amazon_lookups.pop(asin, None)
+            if asin not in products:
+                continue
+
+            item = self._load_wishlist_item(products[asin], wishlist, sort_key)
+            if item:
+                yield item
+
+    def amazon_items_failed(self, failure):
+        # Once AmazonProductApiMiddleware has given up, the batch's items
+        # are dropped, with any other wishlists' that joined its lookup.
+        # Later pages with the same ASINs look them up afresh.
+        wishlist_items = failure.request.meta['wishlist_items']
+        for asin, _, _ in wishlist_items:
+            self.amazon_lookups.pop(asin, None)
+
+        self.crawler.stats.inc_value(
+            'amazon_api/dropped_items', len(wishlist_items), spider=self)
+        self.logger.error(
+            'Amazon lookup %s failed, dropping %d wishlist items (%s): %s',
+            failure.request, len(wishlist_items),
+            ', '.join(
+                '{} on {} #{}'.format(asin, wishlist, sort_key)
+                for asin, wishlist, sort_key
+                in wishlist_items),
+            failure.getErrorMessage())
+
+    def _load_wishlist_item(self, sel, wishlist, sort_key):
+        item_loader = WishlistItemLoader(selector=sel)
+
+        item_loader.add_value('wishlist', wishlist)
+        item_loader.add_value('sort_key', sort_key)
+
+        item_loader.add_xpath('isbn', 'aws:ItemAttributes/aws:EISBN/text()')
+        item_loader.add_xpath('isbn', 'aws:ItemAttributes/aws:ISBN/text()')
+        if not item_loader.get_output_value('isbn'):
+            return
+        item_loader.add_xpath(
+            'isbns', 'aws:ItemAttributes/aws:EISBN/text()')
+        item_loader.add_xpath(
+            'isbns', 'aws:ItemAttributes/aws:ISBN/text()')
+
+        item_loader.add_xpath(
+            'format', 'aws:ItemAttributes/aws:Format/text()')
+        item_loader.add_xpath(
+            'title', 'aws:ItemAttributes/aws:Title/text()')
+        item_loader.add_xpath(
+            'by', 'aws:ItemAttributes/aws:Author/text()')
+        item_loader.add_xpath(
+            'by', 'aws:ItemAttributes/aws:Creator/text()')
+        item_loader.add_xpath(
+            'by', 'aws:ItemAttributes/aws:Artist/text()')
+
+        item_loader.add_xpath('amazon_url', 'aws:DetailPageURL/text()')
+
+        image = WishlistItemImageLoader(selector=sel.xpath('aws:MediumImage'))
+        image.add_xpath('url', 'aws:URL/text()')
+        image.add_xpath('width', 'aws:Width/text()')
+        image.add_xpath('height', 'aws:Height/text()')
+        image.add_value(
+            'caption',
+            sel.xpath('aws:ItemAttributes/aws:Title/text()').extract())
+        item_loader.add_value('image', image.load_item())
+
+        amazon_prices = WishlistItemAmazonPricesLoader(
+            selector=sel.xpath('aws:OfferSummary'))
+        amazon_prices.add_xpath(
+            'list', 'aws:ListPrice/aws:FormattedPrice/text()')
+        amazon_prices.add_xpath('new_count', 'aws:TotalNew/text()')
+        amazon_prices.add_xpath(
+            'new_lowest_price',
+            'aws:LowestNewPrice/aws:FormattedPrice/text()')
+        amazon_prices.add_xpath('used_count', 'aws:TotalUsed/text()')
+        amazon_prices.add_xpath(
+            'used_lowest_price',
+            'aws:LowestUsedPrice/aws:FormattedPrice/text()')
+        item_loader.add_value('amazon_prices', amazon_prices.load_item())
+
+        reviews_iframe_url = sel.xpath(
+            'aws:CustomerReviews/aws:IFrameURL/text()').extract_first()
+        #reviews_iframe_content = requests.get(reviews_iframe_url).text
+        reviews_iframe_content = ''
+
+        reviews_sel = scrapy.selector.Selector(
+            text=reviews_iframe_content, type='html')
+        rating_loader = WishlistItemRatingOverviewLoader(
+            selector=reviews_sel)
+        rating_loader.add_value('url', reviews_iframe_url)
+        rating_loader.add_css(
+            'avg_rating', '.crIFrameNumCustReviews img::attr(alt)')
+        rating_loader.add_css(
+            'star_url', '.crIFrameNumCustReviews img::attr(src)')
+        item_loader.add_value(
+            'rating_overview', rating_loader.load_item())
+
+        return item_loader.load_item()
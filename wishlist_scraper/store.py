@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import time
+
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+from .items import item_values
+
+
+class HoldingsStore(object):
+    # Wishlist items and library holdings from every crawl, kept in one
+    # SQLite file. Each crawl is a run, and its items and holdings are
+    # stored under it rather than replacing the last run's, so holdings
+    # can be compared between runs. The indexed columns are what the page
+    # and the delta query look rows up by; the rest of each item is kept
+    # as JSON, the same as the feed exports'.
+    #
+    # Several stores may write to one file at once, e.g. the wishlist and
+    # library crawls of `scrapy page`, each with its own connection. So
+    # rows are queued and written commit_interval at a time in one short
+    # transaction, and no write lock is held between reactor turns.
+
+    def __init__(self, path, commit_interval=100, timeout=5):
+        self.db = sqlite3.connect(path, timeout=timeout)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                spider TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS wishlist_items (
+                run INTEGER NOT NULL REFERENCES runs (id),
+                wishlist TEXT,
+                sort_key TEXT NOT NULL,
+                isbn TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS wishlist_items_run_wishlist
+            ON wishlist_items (run, wishlist);
+            CREATE TABLE IF NOT EXISTS holdings (
+                run INTEGER NOT NULL REFERENCES runs (id),
+                isbn TEXT NOT NULL,
+                library TEXT NOT NULL,
+                branch TEXT NOT NULL,
+                available INTEGER NOT NULL,
+                copies INTEGER NOT NULL,
+                holds INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS holdings_run_isbn_library_branch
+            ON holdings (run, isbn, library, branch);
+        ''')
+        self.commit_interval = commit_interval
+        self.pending_wishlist_items = []
+        self.pending_holdings = []
+        self.encoder = ScrapyJSONEncoder()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get('HOLDINGS_STORE_FILE'),
+            settings.getint('HOLDINGS_STORE_COMMIT_INTERVAL'),
+            settings.getfloat('HOLDINGS_STORE_TIMEOUT'))
+
+    def _queued(self):
+        pending = len(self.pending_wishlist_items) + len(self.pending_holdings)
+        if pending >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        # Queued rows stay queued if they can't be written, e.g. while
+        # another process holds the lock for longer than the timeout.
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO wishlist_items VALUES (?, ?, ?, ?, ?)',
+                self.pending_wishlist_items)
+            self.db.executemany(
+                'INSERT INTO holdings VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                self.pending_holdings)
+        del self.pending_wishlist_items[:]
+        del self.pending_holdings[:]
+
+    def start_run(self, spider_name):
+        run = self.db.execute(
+            'INSERT INTO runs (spider, started_at) VALUES (?, ?)',
+            (spider_name, time.time())).lastrowid
+        self.db.commit()
+        return run
+
+    def finish_run(self, run):
+        self.flush()
+        self.db.execute(
+            'UPDATE runs SET finished_at = ? WHERE id = ?',
+            (time.time(), run))
+        self.db.commit()
+
+    def last_runs(self, spider_name, count=1):
+        # The IDs of the spider's last `count` finished runs, newest first.
+        return [
+            run
+            for run,
+            in self.db.execute(
+                'SELECT id FROM runs '
+                'WHERE spider = ? AND finished_at IS NOT NULL '
+                'ORDER BY id DESC LIMIT ?',
+                (spider_name, count))
+        ]
+
+    def add_wishlist_item(self, run, item):
+        self.pending_wishlist_items.append(
+            (run, item.get('wishlist'), item['sort_key'], item['isbn'],
+             self.encoder.encode(item)))
+        self._queued()
+
+    def add_holding(self, run, holding):
+        holding = item_values(holding)
+        self.pending_holdings.append(
+            (run, holding['isbn'], holding['library'],
+             holding.get('branch', ''), int(holding.get('available', False)),
+             holding.get('copies', 1), holding.get('holds', 0),
+             self.encoder.encode(holding)))
+        self._queued()
+
+    def wishlist_items(self, run, wishlist=None):
+        # The run's items, or just one wishlist's.
+        if wishlist is None:
+            rows = self.db.execute(
+                'SELECT data FROM wishlist_items WHERE run = ? '
+                'ORDER BY rowid',
+                (run,))
+        else:
+            rows = self.db.execute(
+                'SELECT data FROM wishlist_items '
+                'WHERE run = ? AND wishlist = ? ORDER BY rowid',
+                (run, wishlist))
+        for data, in rows:
+            yield json.loads(data)
+
+    def holdings(self, run, isbns):
+        # In the order they were scraped, which the page lists them in.
+        for isbn in isbns:
+            for data, in self.db.execute(
+                    'SELECT data FROM holdings WHERE run = ? AND isbn = ? '
+                    'ORDER BY rowid',
+                    (run, isbn)):
+                yield json.loads(data)
+
+    def changes(self, run, previous_run):
+        # Per (ISBN, library, branch), how many copies there are and how
+        # many are available, wherever either differs between the two
+        # runs. Branches missing from one of them count as having none.
+        totals = '''
+            SELECT isbn, library, branch,
+                   SUM(available) AS available, SUM(copies) AS copies
+            FROM holdings WHERE run = ?
+            GROUP BY isbn, library, branch
+        '''
+        rows = self.db.execute('''
+            WITH now AS ({totals}), before AS ({totals})
+            SELECT now.isbn, now.library, now.branch,
+                   before.available, before.copies,
+                   now.available, now.copies
+            FROM now LEFT JOIN before USING (isbn, library, branch)
+            WHERE before.copies IS NULL
+               OR now.available != before.available
+               OR now.copies != before.copies
+            UNION ALL
+            SELECT before.isbn, before.library, before.branch,
+                   before.available, before.copies, NULL, NULL
+            FROM before LEFT JOIN now USING (isbn, library, branch)
+            WHERE now.copies IS NULL
+            ORDER BY 1, 2, 3
+        '''.format(totals=totals), (run, previous_run))
+
+        for (isbn, library, branch, available_before, copies_before,
+             available, copies) in rows:
+            yield {
+                'isbn': isbn,
+                'library': library,
+                'branch': branch,
+                'available_before': available_before or 0,
+                'copies_before': copies_before or 0,
+                'available': available or 0,
+                'copies': copies or 0,
+            }
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.db.close()
@@ -1,4 +1,5 @@
-import os.path
+import json
+import os
 import re
 from urllib.parse import urlparse
 
@@ -15,3 +16,63 @@ def qualified_url(response, url):
         return '{}://{}{}/{}'.format(
             response_url.scheme, response_url.netloc,
             os.path.dirname(response_url.path), url)
+
+
+def write_file(path, text):
+    # Written aside and renamed into place, so a reader never sees a
+    # partial file.
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as fp:
+        fp.write(text)
+    os.replace(tmp_path, path)
+
+
+def iter_json_lines(fp):
+    for line in fp:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _isbn10_check_digit(digits):
+    check = -sum((10 - i) * int(d) for i, d in enumerate(digits)) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def _isbn13_check_digit(digits):
+    return str(-sum(
+        int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10)
+
+
+def isbn10_to_13(isbn):
+    digits = '978' + isbn[:9]
+    return digits + _isbn13_check_digit(digits)
+
+
+def isbn13_to_10(isbn):
+    # Only Bookland 978 ISBNs have an ISBN-10 form.
+    if not isbn.startswith('978'):
+        return None
+    digits = isbn[3:12]
+    return digits + _isbn10_check_digit(digits)
+
+
+def isbn_variants(isbns):
+    # Every valid ISBN among `isbns`, in both its ISBN-10 and ISBN-13 form,
+    # in order and without duplicates.
+    variants = []
+    for isbn in isbns:
+        isbn = re.sub(r'[\s-]', '', isbn).upper()
+        if (re.match(r'^\d{9}[\dX]$', isbn) and
+                isbn[9] == _isbn10_check_digit(isbn[:9])):
+            forms = [isbn, isbn10_to_13(isbn)]
+        elif (re.match(r'^97[89]\d{10}$', isbn) and
+                isbn[12] == _isbn13_check_digit(isbn[:12])):
+            forms = [isbn, isbn13_to_10(isbn)]
+        else:
+            continue
+
+        for form in forms:
+            if form and form not in variants:
+                variants.append(form)
+    return variants